@@ -0,0 +1,58 @@
+"""
+Speed benchmarks for odplib and rst2odp.  Run from the top of the
+checkout::
+
+    python -m bench generate --slides 200 --code-blocks 50 deck.rst
+    python -m bench micro -o micro.json
+    python -m bench e2e -o e2e.json
+    python -m bench compare baseline.json e2e.json --threshold 0.15
+
+compare exits with status 1 when a benchmark in the new results is
+slower than the baseline by more than the threshold.
+"""
+import importlib.machinery
+import json
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_rst2odp():
+    """ the bin/rst2odp script as a module """
+    loader = importlib.machinery.SourceFileLoader(
+        "rst2odp", os.path.join(ROOT, "bin", "rst2odp")
+    )
+    return loader.load_module()
+
+
+def measure(func, setup=None, number=1, repeat=5):
+    """
+    Time func(state) where state comes from setup (a fresh one for each
+    repeat), number calls per repeat.  Returns seconds per call as a
+    dict of min, median and the individual repeats.
+    """
+    runs = []
+    for i in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        for j in range(number):
+            func(state)
+        runs.append((time.perf_counter() - start) / number)
+    ordered = sorted(runs)
+    return {
+        "min": ordered[0],
+        "median": ordered[len(ordered) // 2],
+        "runs": runs,
+        "number": number,
+    }
+
+
+def write_results(results, path):
+    """ write results (map of benchmark name to measure output) as JSON """
+    data = json.dumps(results, indent=2, sort_keys=True)
+    if path in (None, "-"):
+        print(data)
+    else:
+        with open(path, "w") as fout:
+            fout.write(data)
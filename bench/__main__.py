@@ -0,0 +1,93 @@
+import argparse
+import sys
+
+from bench import compare, write_results
+from bench.generate import generate
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__)
+    commands = parser.add_subparsers(dest="command")
+
+    gen = commands.add_parser("generate", help="write a synthetic rst deck")
+    gen.add_argument("output", nargs="?", default="-")
+    gen.add_argument("--slides", type=int, default=20)
+    gen.add_argument("--bullet-depth", type=int, default=2)
+    gen.add_argument("--tables", type=int, default=0)
+    gen.add_argument("--code-blocks", type=int, default=0)
+    gen.add_argument("--images", type=int, default=0)
+    gen.add_argument("--imports", type=int, default=0)
+    gen.add_argument(
+        "--assets", help="directory to write the image and .odp to import to"
+    )
+
+    micro = commands.add_parser("micro", help="run the micro-benchmarks")
+    micro.add_argument("-o", "--output", help="JSON results file (default stdout)")
+    micro.add_argument(
+        "--scale", type=float, default=1.0, help="multiply the number of calls"
+    )
+
+    e2e = commands.add_parser("e2e", help="convert generated decks")
+    e2e.add_argument("-o", "--output", help="JSON results file (default stdout)")
+    e2e.add_argument("--repeat", type=int, default=3)
+    e2e.add_argument("--deck", action="append", help="only run this deck")
+
+    cmp_ = commands.add_parser(
+        "compare", help="fail if results regressed against a baseline"
+    )
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("results")
+    cmp_.add_argument("--threshold", type=float, default=0.1)
+    cmp_.add_argument("--key", choices=["min", "median"], default="min")
+
+    opts = parser.parse_args(args)
+    if opts.command == "generate":
+        if opts.assets:
+            from bench.generate import make_assets
+
+            make_assets(opts.assets)
+        rst = generate(
+            slides=opts.slides,
+            bullet_depth=opts.bullet_depth,
+            tables=opts.tables,
+            code_blocks=opts.code_blocks,
+            images=opts.images,
+            imports=opts.imports,
+            assets=opts.assets,
+        )
+        if opts.output == "-":
+            sys.stdout.write(rst)
+        else:
+            with open(opts.output, "w") as fout:
+                fout.write(rst)
+    elif opts.command == "micro":
+        from bench import micro
+
+        write_results(micro.run(opts.scale), opts.output)
+    elif opts.command == "e2e":
+        from bench import e2e
+
+        write_results(e2e.run(opts.repeat, opts.deck), opts.output)
+    elif opts.command == "compare":
+        rows, regressions = compare.compare(
+            compare.load(opts.baseline),
+            compare.load(opts.results),
+            opts.threshold,
+            opts.key,
+        )
+        print(compare.report(rows, regressions))
+        if regressions:
+            sys.stderr.write(
+                "{} benchmarks regressed more than {:.0%}\n".format(
+                    len(regressions), opts.threshold
+                )
+            )
+            return 1
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
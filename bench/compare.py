@@ -0,0 +1,38 @@
+"""
+Compare benchmark results against a stored baseline
+"""
+import json
+
+
+def load(path):
+    with open(path) as fin:
+        return json.load(fin)
+
+
+def compare(baseline, current, threshold=0.1, key="min"):
+    """
+    Returns a list of (name, baseline seconds, current seconds, change)
+    for every benchmark in both, and the names of those that got slower
+    by more than threshold (0.1 is 10%)
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        old = baseline[name][key]
+        new = current[name][key]
+        change = (new - old) / old if old else 0.0
+        rows.append((name, old, new, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def report(rows, regressions):
+    lines = []
+    for name, old, new, change in rows:
+        lines.append(
+            "{:<40} {:>12.6f} {:>12.6f} {:>+8.1%}{}".format(
+                name, old, new, change, "  REGRESSION" if name in regressions else ""
+            )
+        )
+    return "\n".join(lines)
@@ -0,0 +1,36 @@
+"""
+End to end rst to .odp benchmarks over generated decks
+"""
+import shutil
+import tempfile
+
+from bench import load_rst2odp, measure
+from bench.generate import generate, make_assets
+
+DECKS = [
+    ("text-50", dict(slides=50, bullet_depth=2)),
+    ("text-400", dict(slides=400, bullet_depth=3)),
+    ("code-100", dict(slides=100, bullet_depth=1, code_blocks=60)),
+    ("tables-100", dict(slides=100, bullet_depth=1, tables=50)),
+    ("mixed-200", dict(slides=200, tables=20, code_blocks=40, images=20, imports=5)),
+]
+
+
+def run(repeat=3, decks=None):
+    """ map of benchmark name to timings of converting each deck """
+    rst2odp = load_rst2odp()
+    assets = make_assets(tempfile.mkdtemp())
+    results = {}
+    try:
+        for name, params in DECKS:
+            if decks and name not in decks:
+                continue
+
+            source = generate(assets=assets, **params)
+            results["e2e." + name] = measure(
+                lambda state: rst2odp.convert(source, base_dir=assets),
+                repeat=repeat,
+            )
+    finally:
+        shutil.rmtree(assets)
+    return results
@@ -0,0 +1,110 @@
+"""
+Synthetic rst decks for benchmarking.  Images and imported slides need
+files, make_assets creates them in a directory the deck is converted
+relative to (import: paths are relative to the working directory, so
+generate names the .odp to import by its path in that directory).
+"""
+import os
+
+CODE = '''def fib(n):
+    """ {0} """
+    a, b = 0, 1
+    for i in range(n):
+        a, b = b, a + b
+    return a
+'''
+
+IMAGE_NAME = "bench.png"
+IMPORT_NAME = "imported.odp"
+
+
+def make_assets(directory):
+    """ write the image and the .odp to import used by generated decks """
+    from PIL import Image
+    import odplib.preso as preso
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    Image.new("RGB", (640, 480), (40, 90, 160)).save(
+        os.path.join(directory, IMAGE_NAME)
+    )
+    with preso.RenderContext():
+        p = preso.Preso()
+        p.add_slide().add_title_frame()
+        p.slides[-1].write("Imported")
+        p.to_file(os.path.join(directory, IMPORT_NAME)).close()
+    return directory
+
+
+def _bullets(depth, slide):
+    lines = []
+    for level in range(depth):
+        indent = "  " * level
+        for i in range(2):
+            lines.append(
+                "{}* point {}.{} on slide {} with *emphasis* and ``code``".format(
+                    indent, level, i, slide
+                )
+            )
+        lines.append("")
+    return lines
+
+
+def _table(slide):
+    return [
+        "+----------+----------+",
+        "| Name     | Value    |",
+        "+==========+==========+",
+        "| row {0:<4} | {0:<8} |".format(slide % 1000),
+        "+----------+----------+",
+        "| other    | cell     |",
+        "+----------+----------+",
+        "",
+    ]
+
+
+def _spread(count, slides):
+    """ slide indexes count features are put on, spread over the deck """
+    if not count:
+        return set()
+
+    return set(int(i * slides / float(count)) for i in range(min(count, slides)))
+
+
+def generate(
+    slides=20,
+    bullet_depth=2,
+    tables=0,
+    code_blocks=0,
+    images=0,
+    imports=0,
+    assets=None,
+):
+    """
+    rst for a deck of slides sections (plus the title page).  Every
+    slide has bullets nested bullet_depth deep, tables, code_blocks,
+    images and imports are spread over the slides.  Decks with images
+    or imports must be converted relative to the make_assets directory
+    assets.
+    """
+    import_path = os.path.join(assets or "", IMPORT_NAME)
+    table_at = _spread(tables, slides)
+    code_at = _spread(code_blocks, slides)
+    image_at = _spread(images, slides)
+    import_at = _spread(imports, slides)
+    lines = ["Benchmark deck", "==============", ""]
+    for i in range(slides):
+        title = "Slide {}".format(i)
+        lines.extend([title, "-" * len(title), ""])
+        lines.extend(_bullets(bullet_depth, i))
+        if i in table_at:
+            lines.extend(_table(i))
+        if i in code_at:
+            lines.extend([".. code-block:: python", ""])
+            lines.extend("  " + line for line in CODE.format(i).splitlines())
+            lines.append("")
+        if i in image_at:
+            lines.extend([".. image:: {}".format(IMAGE_NAME), ""])
+        if i in import_at:
+            lines.extend([".. import: {} 1".format(import_path), ""])
+    return "\n".join(lines) + "\n"
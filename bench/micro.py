@@ -0,0 +1,91 @@
+"""
+Micro-benchmarks of the odplib hot spots: MixedContent.write,
+MixedContent._add_styles, Template._get_frame_properties and the
+Pygments OdtCodeFormatter.  Each runs in its own RenderContext so style
+names don't leak between them.
+"""
+import odplib.preso as preso
+
+from bench import measure
+from bench.generate import CODE
+
+TEXT = "Some  text with   extra spaces in it"
+
+
+def _text_frame(styles=()):
+    p = preso.Preso()
+    slide = p.add_slide()
+    slide.add_text_frame()
+    for style in styles:
+        slide.push_style(style)
+    return slide
+
+
+def bench_write(number, repeat):
+    # writes into one paragraph slow down as it grows, so keep it short
+    return measure(lambda slide: slide.write(TEXT), _text_frame, number, repeat)
+
+
+def bench_add_styles(number, repeat):
+    styles = [
+        preso.ParagraphStyle(**{"fo:text-align": "start"}),
+        preso.TextStyle(**{"fo:font-weight": "bold", "fo:color": "#102030"}),
+    ]
+
+    def add_styles(slide):
+        slide.cur_element._add_styles()
+        # the next call has to add the paragraph again
+        slide.cur_element.pop_node()
+
+    return measure(add_styles, lambda: _text_frame(styles), number, repeat)
+
+
+def bench_frame_properties(number, repeat):
+    template = preso._default_template()
+    master_page = list(template.get_master_page_names())[0]
+
+    def properties(template):
+        template.get_frame_properties(master_page, "title")
+        template.get_p_properties(master_page, "outline")
+        template.get_span_properties(master_page, "outline")
+
+    return measure(properties, lambda: template, number, repeat)
+
+
+def bench_code_formatter(number, repeat):
+    if not preso.PYGMENTS_FOUND:
+        return None
+
+    import pygments
+
+    code = CODE.format("docstring") * 5
+    tokens = list(preso.get_lexer("python").get_tokens(code))
+    formatter_class = preso._formatter_class()
+
+    def format_code(slide):
+        pygments.format(
+            tokens,
+            formatter_class(slide.cur_element, slide._preso, style="default"),
+        )
+
+    return measure(format_code, _text_frame, number, repeat)
+
+
+# name, function, calls per repeat, repeats
+BENCHMARKS = [
+    ("MixedContent.write", bench_write, 20, 100),
+    ("MixedContent._add_styles", bench_add_styles, 2000, 5),
+    ("Template._get_frame_properties", bench_frame_properties, 500, 5),
+    ("OdtCodeFormatter", bench_code_formatter, 10, 5),
+]
+
+
+def run(scale=1.0):
+    """ map of benchmark name to timings, scale multiplies the repeats """
+    results = {}
+    for name, func, number, repeat in BENCHMARKS:
+        with preso.RenderContext():
+            result = func(number, max(1, int(repeat * scale)))
+        if result is not None:
+            results["micro." + name] = result
+    return results
@@ -0,0 +1,172 @@
+"""
+Persistent caches used to speed up repeated builds.
+
+Every cache stores its entries under a directory the caller owns (rst2odp
+uses ``--cache-dir``).  Entries are written to a temporary file first and
+then renamed into place, so a build that is interrupted never leaves a
+truncated entry behind.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import zlib
+
+
+def hash_key(*parts):
+    """
+    Stable hex digest for json-serializable ``parts``
+
+    >>> hash_key('a', 1) == hash_key('a', 1)
+    True
+    >>> hash_key('a', 1) == hash_key('a', 2)
+    False
+    """
+    data = json.dumps(parts, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def atomic_write(path, data):
+    """ write ``data`` (bytes) to ``path`` via a rename """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fout:
+            fout.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonCache(object):
+    """
+    Directory of json entries with an in-memory layer in front of it.
+    Entries are spread over subdirectories named after the first two
+    characters of their key.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._memory = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        if key in self._memory:
+            return self._memory[key]
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as fin:
+                entry = json.loads(fin.read().decode("utf-8"))
+        except ValueError:
+            # corrupt entry, treat as a miss so it is rewritten
+            return None
+
+        if entry.get("version") != self.VERSION:
+            return None
+
+        self._memory[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        entry = dict(entry, version=self.VERSION)
+        self._memory[key] = entry
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        atomic_write(path, json.dumps(entry).encode("utf-8"))
+
+
+class CodeCache(JsonCache):
+    """
+    Highlighted code fragments keyed by code, language, Pygments style,
+    mono font and the styling context the block is written into.
+
+    An entry holds the ``text:p`` nodes produced by ``OdtCodeFormatter``
+    (serialized), the text/paragraph styles they reference and the path
+    from the insertion point to the node writing continues at.
+    """
+
+    def key(self, code, language, pygments_style, mono_font, context):
+        return hash_key(code, language, pygments_style, mono_font, context)
+
+
+class SectionCache(JsonCache):
+    """
+    Translated top level sections (``rst2odp --incremental``) keyed by the
+    section's doctree, the build settings, the images it uses and the
+    translator state carried into it.
+
+    An entry is a ``Preso.page_entry`` (serialized ``draw:page`` nodes and
+    the automatic styles and pictures they use) plus the docinfo state
+    the section leaves behind.
+    """
+
+    def key(self, build, section, images, state):
+        return hash_key(build, section, images, state)
+
+
+class MemberCache(object):
+    """
+    Deflated package members (styles.xml, settings.xml, pictures, ...)
+    keyed by a hash of their content and the compression level, so
+    packaging can write them without compressing them again.
+
+    An entry file holds the crc and size of the content followed by the
+    raw deflate stream.
+    """
+
+    HEADER = struct.Struct("<II")
+
+    def __init__(self, directory, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.directory = directory
+        self.level = level
+        self._memory = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, data):
+        return "{}-{}".format(hashlib.sha1(data).hexdigest(), self.level)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".z")
+
+    def get(self, data):
+        """ (payload, crc, size) for data (bytes), deflating it on a miss """
+        key = self.key(data)
+        if key in self._memory:
+            return self._memory[key]
+
+        path = self._path(key)
+        if os.path.exists(path):
+            with open(path, "rb") as fin:
+                raw = fin.read()
+            if len(raw) >= self.HEADER.size:
+                crc, size = self.HEADER.unpack(raw[: self.HEADER.size])
+                entry = (raw[self.HEADER.size :], crc, size)
+                if size == len(data):
+                    self._memory[key] = entry
+                    return entry
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        entry = (payload, zlib.crc32(data) & 0xFFFFFFFF, len(data))
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        atomic_write(path, self.HEADER.pack(entry[1], entry[2]) + payload)
+        self._memory[key] = entry
+        return entry
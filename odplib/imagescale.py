@@ -1,5 +1,3 @@
-from PIL import Image
-
 CROP = 1  # Fit smallest side to screen (cuts off parts of image)
 FIT = 2  # Fit largest side (leaves black spaces)
 FILL = 3  # Adjust scale to fill (may distort)
@@ -15,6 +13,8 @@ class ImageScale(object):
         given a x and y of dest, determine the ratio and return
         an (x,y,w,h) for a output image.
         """
+        from PIL import Image
+
         # get image size
         image = Image.open(self.path)
         width, height = image.size
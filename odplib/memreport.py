@@ -0,0 +1,132 @@
+"""
+Memory report of a build traced with tracing.Tracer(memory=True): the
+peak of each build phase, the top allocation sites and what each slide
+keeps alive (element tree and picture bytes).
+"""
+import os
+
+import lxml.etree as et
+
+from odplib import preso
+
+# span categories reported as build phases, in build order
+PHASES = [
+    "parse",
+    "template",
+    "translate",
+    "highlight",
+    "picture",
+    "serialize",
+    "package",
+    "write",
+]
+
+
+def phase_peaks(events):
+    """
+    map of phase (span category) to (peak bytes, spans) over the traced
+    events.  The peak of a span includes the spans nested in it.
+    """
+    peaks = {}
+    for event in events:
+        args = event.get("args", {})
+        if "memory_peak" not in args:
+            continue
+
+        peak, count = peaks.get(event["cat"], (0, 0))
+        peaks[event["cat"]] = (max(peak, args["memory_peak"]), count + 1)
+    return peaks
+
+
+def picture_sizes(presentation):
+    """ map of picture internal name to bytes it adds to the package """
+    sizes = {}
+    for p in presentation._pictures:
+        if isinstance(p, preso.Picture):
+            sizes[p.internal_name] = os.path.getsize(p.filepath)
+        else:
+            # ImportedPicture, kept in memory
+            sizes[p.internal_name] = len(p.data)
+    return sizes
+
+
+def slide_breakdown(presentation):
+    """
+    (page number, elements, serialized xml bytes, picture bytes) for each
+    slide that was rendered
+    """
+    sizes = picture_sizes(presentation)
+    rows = []
+    for slide in presentation.slides:
+        page = getattr(slide, "_page", None)
+        if page is None:
+            continue
+
+        elements = sum(1 for node in page.iter())
+        xml_bytes = len(et.tostring(page))
+        picture_bytes = sum(sizes.get(name, 0) for name in preso.picture_refs([page]))
+        rows.append((slide.page_number, elements, xml_bytes, picture_bytes))
+    return rows
+
+
+def _kb(size):
+    return "{:,.1f} KiB".format(size / 1024.0)
+
+
+def format_report(
+    tracer, snapshot=None, presentation=None, output_size=None, top=10
+):
+    """ text report, snapshot is a tracemalloc.Snapshot taken at the end """
+    lines = ["Memory report", "", "Peak traced memory by phase:"]
+    peaks = phase_peaks(tracer.events)
+    for phase in PHASES + sorted(set(peaks) - set(PHASES)):
+        if phase in peaks:
+            peak, count = peaks[phase]
+            lines.append("  {:<12} {:>14}  ({} spans)".format(phase, _kb(peak), count))
+    lines.append("  {:<12} {:>14}".format("overall", _kb(tracer.memory_peak())))
+
+    if output_size is not None:
+        lines.extend(
+            [
+                "",
+                "Package: {} (get_data holds it twice while copying the"
+                " buffer out)".format(_kb(output_size)),
+            ]
+        )
+
+    if snapshot is not None:
+        lines.extend(["", "Top {} allocation sites alive at the end:".format(top)])
+        for stat in snapshot.statistics("lineno")[:top]:
+            frame = stat.traceback[0]
+            lines.append(
+                "  {:>14} {:>8} blocks  {}:{}".format(
+                    _kb(stat.size), stat.count, frame.filename, frame.lineno
+                )
+            )
+
+    if presentation is not None:
+        rows = slide_breakdown(presentation)
+        lines.extend(
+            [
+                "",
+                "Per slide:",
+                "  {:>5} {:>9} {:>14} {:>14}".format(
+                    "page", "elements", "xml", "pictures"
+                ),
+            ]
+        )
+        for page, elements, xml_bytes, picture_bytes in rows:
+            lines.append(
+                "  {:>5} {:>9} {:>14} {:>14}".format(
+                    page, elements, _kb(xml_bytes), _kb(picture_bytes)
+                )
+            )
+        lines.append(
+            "  {:>5} {:>9} {:>14} {:>14}".format(
+                "total",
+                sum(row[1] for row in rows),
+                _kb(sum(row[2] for row in rows)),
+                _kb(sum(row[3] for row in rows)),
+            )
+        )
+    return "\n".join(lines) + "\n"
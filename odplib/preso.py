@@ -6,7 +6,7 @@ Copyright 2008-2009 Matt Harrison
 Licensed under Apache License, Version 2.0 (current)
 """
 
-import codecs
+import collections
 import copy
 
 try:
@@ -15,22 +15,20 @@ except ImportError:
     from io import BytesIO as Sio
 import lxml.etree as et
 
-from xml.dom import minidom
+import importlib.util
 import os
+import re
 import sys
-import tempfile
+import threading
 
-try:
-    import pygments
-    from pygments import formatter, lexers
-
-    PYGMENTS_FOUND = True
-except ImportError:
+# PIL, pygments and minidom are imported when first needed so
+# that importing this module (and starting rst2odp) stays cheap
+PYGMENTS_FOUND = importlib.util.find_spec("pygments") is not None
+if not PYGMENTS_FOUND:
     sys.stderr.write("Could not import pygments code highlighting will not work")
-    PYGMENTS_FOUND = False
 from odplib import zipwrap
-from PIL import Image
 from odplib import imagescale
+from odplib import tracing
 
 DOC_CONTENT_ATTRIB = {
     "office:version": "1.0",
@@ -88,6 +86,246 @@ PYGMENTS_STYLE = "default"
 SLIDE_WIDTH = 28  # cm
 SLIDE_HEIGHT = 21
 
+_DATA_FILES = {}  # map of DATA_DIR file name to contents
+_LEXERS = {}  # map of language to pygments lexer
+_DEFAULT_TEMPLATE = []  # Template for styles.xml, created on first use
+_TEMPLATES = {}  # map of template path to (mtime, Template)
+
+
+def get_data_file(name):
+    """ contents (bytes) of a file in DATA_DIR, read once per process """
+    try:
+        return _DATA_FILES[name]
+    except KeyError:
+        with open(os.path.join(DATA_DIR, name), "rb") as fin:
+            data = _DATA_FILES[name] = fin.read()
+        return data
+
+
+def get_lexer(language):
+    """ pygments lexer for language, created once per process """
+    try:
+        return _LEXERS[language]
+    except KeyError:
+        from pygments import lexers
+
+        lexer = _LEXERS[language] = lexers.get_lexer_by_name(
+            language, stripall=True
+        )
+        return lexer
+
+
+def _default_template():
+    """
+    Template for the bundled styles.xml.  It is only read from, so one
+    instance is shared by every Preso.
+    """
+    if not _DEFAULT_TEMPLATE:
+        template = Template()
+        template.set_style_data(get_data_file("styles.xml"))
+        _DEFAULT_TEMPLATE.append(template)
+    return _DEFAULT_TEMPLATE[0]
+
+
+def load_template(path):
+    """
+    Template for the .otp at path.  Templates are only read from, so the
+    parsed file is kept until it changes on disk.
+    """
+    mtime = os.path.getmtime(path)
+    key = os.path.abspath(path)
+    if key not in _TEMPLATES or _TEMPLATES[key][0] != mtime:
+        with current_context().span("load template", "template", path=path):
+            _TEMPLATES[key] = (mtime, Template(path))
+    return _TEMPLATES[key][1]
+
+
+def reset_registries():
+    """
+    Forget style names and id counters the global context handed out to
+    earlier presentations, so the next one built in this process matches
+    a fresh run
+    """
+    TextStyle.ATTRIB2NAME.clear()
+    TextStyle.TEXT_COUNT = 0
+    for cls in STYLE_CLASSES.values():
+        # subclasses share TextStyle's count until they first name a style
+        if cls is not TextStyle and "TEXT_COUNT" in vars(cls):
+            del cls.TEXT_COUNT
+    MixedContent.draw_id = 0
+    Picture.COUNT = 0
+    Animation.ANIM_COUNT = 1
+
+
+_LOCAL = threading.local()
+
+
+def current_context():
+    """ RenderContext active in this thread (the global one if none is) """
+    return getattr(_LOCAL, "context", None) or GLOBAL_CONTEXT
+
+
+class RenderContext(object):
+    """
+    State of one conversion: the settings that used to be module globals
+    (slide size, fonts, Pygments style), the style name registry and the
+    id counters.  Activate it for the current thread with ``with
+    context:``; Presos, styles and frames created while it is active use
+    it.  Each thread can convert with its own context, templates are
+    shared between them read only.
+    """
+
+    def __init__(
+        self,
+        slide_width=None,
+        slide_height=None,
+        mono_font=None,
+        normal_font=None,
+        pygments_style=None,
+        tracer=None,
+        file_data=None,
+    ):
+        # unset settings start from the module defaults
+        self.slide_width = SLIDE_WIDTH if slide_width is None else slide_width
+        self.slide_height = SLIDE_HEIGHT if slide_height is None else slide_height
+        self.mono_font = mono_font or MONO_FONT
+        self.normal_font = normal_font or NORMAL_FONT
+        self.pygments_style = pygments_style or PYGMENTS_STYLE
+        self.name_log = None  # list collecting styles that got a new name when set
+        self.tracer = tracer  # tracing.Tracer recording build phases
+        # map of absolute path to the bytes of files read ahead (pictures)
+        self.file_data = file_data or {}
+        self._attrib2name = {}  # map of sorted style items to name
+        self._attribs = {}  # map of sorted items to the shared attribute dict
+        self._text_counts = {}  # map of style class to next number
+        self._draw_id = 0
+        self._picture_count = 0
+        self._anim_count = 1
+        self._previous = []
+
+    def __enter__(self):
+        self._previous.append(getattr(_LOCAL, "context", None))
+        _LOCAL.context = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _LOCAL.context = self._previous.pop()
+
+    def read_file(self, path):
+        """ bytes of the file at path, from file_data when read ahead """
+        data = self.file_data.get(os.path.abspath(path))
+        if data is None:
+            with open(path, "rb") as fin:
+                data = fin.read()
+        return data
+
+    def span(self, name, category="build", **args):
+        """ tracing span for a build phase (a no-op unless tracing) """
+        if self.tracer is None:
+            return tracing.NULL_SPAN
+
+        return self.tracer.span(name, category, **args)
+
+    def style_name(self, style):
+        """ name for style, equal styles share a name """
+        key = tuple(sorted(style.styles.items()))
+        if key in self._attrib2name:
+            return self._attrib2name[key]
+
+        cls = style.__class__
+        # like the class attributes this replaces, a style class uses the
+        # count of its base until it names a style itself
+        count = [self._text_counts[k] for k in cls.__mro__ if k in self._text_counts]
+        count = count[0] if count else 0
+        name = style.PREFIX % count
+        self._text_counts[cls] = count + 1
+        self._attrib2name[key] = name
+        self._log_name(style)
+        return name
+
+    def intern_attrib(self, attrib):
+        """
+        a dict equal to attrib shared by everyone interning one, so equal
+        style properties are only kept once.  Don't change it after.
+        """
+        key = tuple(sorted(attrib.items()))
+        return self._attribs.setdefault(key, attrib)
+
+    def _log_name(self, style):
+        if self.name_log is not None:
+            self.name_log.append(style)
+
+    def reset_text_counts(self):
+        self._text_counts[TextStyle] = 0
+        self._text_counts[ParagraphStyle] = 0
+
+    def next_draw_id(self):
+        self._draw_id += 1
+        return "mc-{}".format(self._draw_id - 1)
+
+    def next_picture_number(self):
+        self._picture_count += 1
+        return self._picture_count - 1
+
+    def next_anim_id(self):
+        self._anim_count += 1
+        return "id%d" % (self._anim_count - 1)
+
+
+def _module_setting(name):
+    def get(self):
+        return globals()[name]
+
+    def set(self, value):
+        globals()[name] = value
+
+    return property(get, set)
+
+
+class GlobalRenderContext(RenderContext):
+    """
+    Context used when none is active.  It keeps its state where earlier
+    releases did (module globals and class attributes), so code setting
+    preso.MONO_FONT or MixedContent.draw_id still works.
+    """
+
+    slide_width = _module_setting("SLIDE_WIDTH")
+    slide_height = _module_setting("SLIDE_HEIGHT")
+    mono_font = _module_setting("MONO_FONT")
+    normal_font = _module_setting("NORMAL_FONT")
+    pygments_style = _module_setting("PYGMENTS_STYLE")
+
+    def style_name(self, style):
+        cls = style.__class__
+        key = tuple(sorted(style.styles.items()))
+        if key in cls.ATTRIB2NAME:
+            return cls.ATTRIB2NAME[key]
+
+        name = style.PREFIX % cls.TEXT_COUNT
+        cls.TEXT_COUNT += 1
+        cls.ATTRIB2NAME[key] = name
+        self._log_name(style)
+        return name
+
+    def reset_text_counts(self):
+        TextStyle.TEXT_COUNT = 0
+        ParagraphStyle.TEXT_COUNT = 0
+
+    def next_draw_id(self):
+        MixedContent.draw_id += 1
+        return "mc-{}".format(MixedContent.draw_id - 1)
+
+    def next_picture_number(self):
+        Picture.COUNT += 1
+        return Picture.COUNT - 1
+
+    def next_anim_id(self):
+        Animation.ANIM_COUNT += 1
+        return "id%d" % (Animation.ANIM_COUNT - 1)
+
+
+GLOBAL_CONTEXT = GlobalRenderContext()
+
 
 def cwd_decorator(func):
     """
@@ -189,6 +427,8 @@ def to_xml(node, pretty=False):
 
 def pretty_xml(string_input, add_ns=False):
     """ pretty indent string_input """
+    from xml.dom import minidom
+
     if add_ns:
         elem = "<foo "
         for key, value in DOC_CONTENT_ATTRIB.items():
@@ -206,13 +446,54 @@ def ns(namespace, element):
     return "{%s}%s" % (DOC_CONTENT_ATTRIB["xmlns:" + namespace], element)
 
 
+# wrapper declaring the ODF prefixes for raw xml fragments
+RAW_ROOT = "<root {}>".format(
+    " ".join('{}="{}"'.format(k, v) for k, v in DOC_CONTENT_ATTRIB.items())
+)
+RAW_CACHE_SIZE = 256  # parsed raw fragments kept by parse_raw
+_RAW_FRAGMENTS = collections.OrderedDict()  # map of content to its nodes
+_RAW_LOCK = threading.Lock()
+
+
+def parse_raw(content):
+    """
+    etree nodes for a raw xml fragment that uses the ODF prefixes.
+    Fragments are parsed once and kept (the most recently used
+    RAW_CACHE_SIZE of them), each call gets its own copy of the nodes.
+    """
+    with _RAW_LOCK:
+        nodes = _RAW_FRAGMENTS.get(content)
+        if nodes is not None:
+            _RAW_FRAGMENTS.move_to_end(content)
+    if nodes is None:
+        nodes = et.fromstring(RAW_ROOT + content + "</root>").getchildren()
+        with _RAW_LOCK:
+            _RAW_FRAGMENTS[content] = nodes
+            while len(_RAW_FRAGMENTS) > RAW_CACHE_SIZE:
+                _RAW_FRAGMENTS.popitem(last=False)
+    return [copy.deepcopy(node) for node in nodes]
+
+
+def lex_code(code, language):
+    """
+    Tokenize code the way Slide.add_code does.  Token types are returned
+    as strings so the result can be sent between processes.
+
+    >>> lex_code('x', 'python')[0]
+    ('Token.Name', 'x')
+    """
+    lexer = get_lexer(language)
+    return [(str(ttype), value) for ttype, value in lexer.get_tokens(code)]
+
+
 def add_cell(preso, pos, width, height, padding=1, top_margin=4, left_margin=2):
     """ Add a text frame to current slide """
-    available_width = SLIDE_WIDTH
+    context = current_context()
+    available_width = context.slide_width
     available_width -= left_margin * 2
     available_width -= padding * (width - 1)
     column_width = available_width / width
-    avail_height = SLIDE_HEIGHT
+    avail_height = context.slide_height
     avail_height -= top_margin
     avail_height -= padding * (height - 1)
     column_height = avail_height / height
@@ -240,8 +521,9 @@ class Preso(object):
     mime_type = "application/vnd.oasis.opendocument.presentation"
 
     def __init__(self, add_template=True, template_paths=None):
+        self.context = current_context()
         self.slides = []
-        self.limit_pages = []  # can be list of page numbers (not indexes to export)
+        self.limit_pages = set()  # page numbers (not indexes) to export, all if empty
         self._pictures = []  # list of Picture instances
         self._footer_count = 0
         # xml elements
@@ -251,6 +533,16 @@ class Preso(object):
         self._presentation = None
 
         self._styles_added = {}
+        self._style_log = None  # list collecting add_style calls when set
+        self.code_cache = None  # cache.CodeCache for highlighted code
+        self.member_cache = None  # cache.MemberCache for deflated members
+        # zipwrap.MemberIndex of the previous output, whose unchanged
+        # members are copied rather than compressed again
+        self.previous_output = None
+        self.dedupe_styles = True  # merge and prune automatic styles in to_xml
+        self.normalize = True  # merge and drop redundant spans in to_xml
+        # elements and bytes the last to_xml saved by normalizing
+        self.normalize_stats = {"nodes": 0, "bytes": 0}
 
         self._init_xml()
         self.master_page_name_cover = None
@@ -260,23 +552,29 @@ class Preso(object):
         self.template_files = []  # ordered list of templates to look for styles in
 
         if add_template:
-            self.default_template = Template()
-            with open(os.path.join(DATA_DIR, "styles.xml"), "rb") as fin:
-                data = fin.read()
-                self.default_template.set_style_data(data)
+            self.default_template = _default_template()
         elif template_paths:
             for p in template_paths:
                 self.set_template(p)
         # Reset PREFIX (makes testing easier)
-        TextStyle.TEXT_COUNT = 0
-        ParagraphStyle.TEXT_COUNT = 0
+        self.context.reset_text_counts()
 
     @classmethod
-    def from_file(cls, path):
-        zipfile = zipwrap.Zippier(path, True)
+    def from_file(cls, path, lazy=False):
+        """
+        Presentation read from the .odp at path.  With lazy=True its
+        slides are a LazySlides that only parses the pages accessed.
+        """
+        if lazy:
+            return cls._from_file_lazy(path)
+
+        zipfile = zipwrap.Zippier(path)
         styles = et.fromstring(zipfile.cat("styles.xml").encode("utf-8"))
         content = et.fromstring(zipfile.cat("content.xml").encode("utf-8"))
         p = Preso(add_template=False, template_paths=[path])
+        # its automatic styles include those of styles.xml, which pages
+        # don't reference
+        p.dedupe_styles = False
         if content.tag != ns("office", "document-content"):
             sys.stderr.write(
                 "WRONG ROOT ELEM!",
@@ -305,6 +603,15 @@ class Preso(object):
             p.slides.append(s)
         return p
 
+    @classmethod
+    def _from_file_lazy(cls, path):
+        p = Preso(add_template=False, template_paths=[path])
+        p.dedupe_styles = False
+        p._styles = p.template_files[0].styles.find(ns("office", "styles"))
+        content = zipwrap.Zippier(path).cat("content.xml", True)
+        p.slides = LazySlides(p, content)
+        return p
+
     def _init_xml(self):
         self._root = el("office:document-content", attrib=DOC_CONTENT_ATTRIB)
         sub_el(self._root, "office:scripts")
@@ -366,6 +673,14 @@ class Preso(object):
                 master_page_name, class_name
             )
 
+    def get_auto_styles(self):
+        """ office:automatic-styles element of content.xml """
+        return self._auto_styles
+
+    def get_styles(self):
+        """ office:styles element of a presentation read with from_file """
+        return self._styles
+
     def add_imported_auto_style(self, style_node):
         self._auto_styles.append(style_node)
 
@@ -391,26 +706,22 @@ class Preso(object):
         if style_file and not os.path.exists(style_file):
             sys.stderr.write("template file {} doesn't exist".format(style_file))
             assert False
-        with tempfile.NamedTemporaryFile() as fout:
-            filename = fout.name
-            zip_odp = self.to_file(filename, write_style=not style_file)
-            if style_file:
-                self.add_otp_style(zip_odp, style_file)
-            zip_odp.close()
-            with open(filename, "rb") as fin:
-                data = fin.read()
-                return data
+        fout = Sio()
+        zip_odp = self.to_file(fout, write_style=not style_file)
+        if style_file:
+            self.add_otp_style(zip_odp, style_file)
+        zip_odp.close()
+        return fout.getvalue()
 
     def set_template(self, template_file):
-        global SLIDE_WIDTH
-        global SLIDE_HEIGHT
-        self.template_files.append(Template(template_file))
+        self.template_files.append(load_template(template_file))
         if len(self.template_files) == 1:
             # going in order of precedence. Can load multiple templates, but first one is default
             master_pages = list(self.template_files[-1].get_master_page_names())
             self.master_page_name_cover = master_pages[0]
             self.master_page_name_normal = master_pages[-1]
-        SLIDE_WIDTH, SLIDE_HEIGHT = self.template_files[-1].get_size()
+        size = self.template_files[-1].get_size()
+        self.context.slide_width, self.context.slide_height = size
 
     def add_otp_style(self, zip_odp, style_file):
         """
@@ -418,11 +729,11 @@ class Preso(object):
         """
         style = zipwrap.Zippier(style_file)
         for picture_file in style.ls("Pictures"):
-            zip_odp.write(picture_file, style.cat(picture_file, True))
+            self._pack(zip_odp, picture_file, lambda: style.cat(picture_file, True))
         xml_data = style.cat("styles.xml", False)
         # import pdb;pdb.set_trace()
         xml_data = self.override_styles(xml_data)
-        zip_odp.write("styles.xml", xml_data)
+        self._pack(zip_odp, "styles.xml", xml_data)
 
     def get_properties(self, master_page_name, class_name):
         for template in self.template_files:
@@ -438,17 +749,49 @@ class Preso(object):
         ['META-INF/manifest.xml', 'content.xml', 'meta.xml', 'mimetype', 'settings.xml', 'styles.xml']
         """
         out = zipwrap.Zippier(filename, "w")
-        out.write("mimetype", self.mime_type)
-        for p in self._pictures:
-            out.write("Pictures/%s" % p.internal_name, p.get_data())
-        out.write("content.xml", self.to_xml())
+        self._pack(out, "mimetype", self.mime_type)
+        content = self.to_xml()
+        pictures = self._pictures
+        if self.limit_pages:
+            # don't read pictures only used on pages that aren't output
+            used = picture_refs([self._root])
+            pictures = [p for p in pictures if p.internal_name in used]
+        for p in pictures:
+            self._pack(out, "Pictures/%s" % p.internal_name, p.get_data, True)
+        self._pack(out, "content.xml", content)
         if write_style:
-            out.write("styles.xml", self.styles_xml())
-        out.write("meta.xml", self.meta_xml())
-        out.write("settings.xml", self.settings_xml())
-        out.write("META-INF/manifest.xml", self.manifest_xml(out))
+            self._pack(out, "styles.xml", self.styles_xml, True)
+        self._pack(out, "meta.xml", self.meta_xml, True)
+        self._pack(out, "settings.xml", self.settings_xml, True)
+        self._pack(out, "META-INF/manifest.xml", lambda: self.manifest_xml(out))
         return out
 
+    def _pack(self, out, location, data, cached=False):
+        """
+        write data (or what calling it returns) to location of out.
+        Members the previous output already holds are copied from it,
+        cached members (the same from build to build) are deflated
+        through member_cache when there is one.
+        """
+        with self.context.span("pack", "package", member=location):
+            if callable(data):
+                data = data()
+            if self.previous_output is not None:
+                if not isinstance(data, bytes):
+                    data = data.encode("utf-8")
+                entry = self.previous_output.get(data)
+                if entry is not None:
+                    out.write_deflated(location, *entry)
+                    return
+
+            if cached and self.member_cache is not None:
+                if not isinstance(data, bytes):
+                    data = data.encode("utf-8")
+                payload, crc, size = self.member_cache.get(data)
+                out.write_deflated(location, payload, crc, size)
+            else:
+                out.write(location, data)
+
     def manifest_xml(self, zippy):
         content = """<?xml version="1.0" encoding="UTF-8"?>
 <manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0">
@@ -493,39 +836,131 @@ class Preso(object):
 """
 
     def settings_xml(self):
-        filename = os.path.join(DATA_DIR, "settings.xml")
-        with open(filename, "rb") as fin:
-            return fin.read()
+        return get_data_file("settings.xml")
 
     def override_styles(self, data):
-        if NORMAL_FONT != "Arial":
-            data = data.replace(
-                u'fo:font-family="Arial"', u'fo:font-family="%s"' % NORMAL_FONT
-            )
+        font = self.context.normal_font
+        if font != "Arial":
+            data = data.replace(u'fo:font-family="Arial"', u'fo:font-family="%s"' % font)
         return data
 
     def styles_xml(self):
-        filename = os.path.join(DATA_DIR, "styles.xml")
-        with codecs.open(filename, encoding="utf-8") as fin:
-            data = fin.read()
+        data = get_data_file("styles.xml").decode("utf-8")
         data = self.override_styles(data)
         return data.encode("utf-8")
 
     def to_xml(self):
+        with self.context.span("to_xml", "serialize", slides=len(self.slides)):
+            return self._to_xml()
+
+    def _to_xml(self):
+        if self.normalize:
+            normalize_span = self.context.span("normalize text", "serialize").start()
+            plain_styles = self._plain_text_styles()
+            self.normalize_stats = {"nodes": 0, "bytes": 0}
         for i, slide in enumerate(self.slides):
             if self.limit_pages and i + 1 not in self.limit_pages:
                 continue
 
+            if isinstance(slide, SkippedSlide):
+                continue
+
             if slide.footer:
                 footer_node = slide.footer.get_node()
                 self._presentation.append(footer_node)
             node = slide.get_node()
             self._presentation.append(node)
+            if self.normalize and not isinstance(slide, XMLSlide):
+                nodes, saved = normalize_text(node, plain_styles)
+                self.normalize_stats["nodes"] += nodes
+                self.normalize_stats["bytes"] += saved
+        if self.normalize:
+            normalize_span.stop(
+                nodes_removed=self.normalize_stats["nodes"],
+                bytes_saved=self.normalize_stats["bytes"],
+            )
+        if self.dedupe_styles:
+            with self.context.span("dedupe styles", "serialize"):
+                self._finish_auto_styles()
         return to_xml(self._root)
 
+    def _plain_text_styles(self):
+        """ names of the automatic text styles that set no properties """
+        names = set()
+        for node in self._auto_styles:
+            if node.get(ns("style", "family")) != "text":
+                continue
+
+            if all(len(child) == 0 and not child.attrib for child in node):
+                names.add(node.get(ns("style", "name")))
+        return names
+
+    def _finish_auto_styles(self):
+        """
+        Merge automatic styles that are defined more than once
+        (update_style, graphic-properties comments, raw and imported
+        styles add copies), point references at the merged names and
+        drop the styles no page uses
+        """
+        name_attr = ns("style", "name")
+        keys = {}  # map of name to canonical form, None if defined differently
+        for node in self._auto_styles:
+            name = node.get(name_attr)
+            if name is not None:
+                key = _style_key(node)
+                keys[name] = key if keys.get(name, key) == key else None
+
+        merged = {}  # map of canonical form to name kept
+        renames = {}
+        seen = set()
+        for node in list(self._auto_styles):
+            name = node.get(name_attr)
+            key = keys.get(name)
+            if key is None:
+                continue
+
+            kept = merged.setdefault(key, name)
+            if kept != name:
+                renames[name] = kept
+                self._auto_styles.remove(node)
+                # so add_style adds it again if a later page uses it
+                self._styles_added.pop(name, None)
+            elif name in seen:
+                # the same style added twice
+                self._auto_styles.remove(node)
+            seen.add(name)
+
+        if renames:
+            for node in self._root.iter():
+                for attr, value in node.items():
+                    if attr.endswith("style-name") and value in renames:
+                        node.set(attr, renames[value])
+                    elif attr.endswith("class-names"):
+                        names = [renames.get(n, n) for n in value.split()]
+                        node.set(attr, " ".join(names))
+
+        # keep the styles pages use and the styles those refer to
+        used = _style_refs(self._presentation)
+        refs = dict(
+            (node.get(name_attr), _style_refs(node)) for node in self._auto_styles
+        )
+        todo = list(used)
+        while todo:
+            for name in refs.pop(todo.pop(), ()):
+                if name not in used:
+                    used.add(name)
+                    todo.append(name)
+        for node in list(self._auto_styles):
+            name = node.get(name_attr)
+            if name is not None and name not in used:
+                self._auto_styles.remove(node)
+                self._styles_added.pop(name, None)
+
     def add_style(self, style):
         name = style.name
         node = style.style_node()
+        if self._style_log is not None:
+            self._style_log.append(style)
         if name not in self._styles_added:
             self._styles_added[name] = 1
             self._auto_styles.append(node)
@@ -540,18 +975,309 @@ class Preso(object):
         self.slides.append(s)
         return s
 
+    def skip_pages(self, count):
+        """
+        Add count SkippedSlides for pages that won't be output, so later
+        slides keep their page numbers
+        """
+        if self.slides:
+            self.slides[-1].finish_slide()
+        for i in range(count):
+            self.slides.append(SkippedSlide(self, page_number=len(self.slides) + 1))
+
     def copy_slide(self, s):
         new_s = s._copy()
         self.slides.append(new_s)
         return new_s
 
+    def generate_slides(self, records, image_fields=()):
+        """
+        Replace the last slide with a clone of it for each record (a map
+        of field name to value).  {field} in its text is replaced by the
+        record's value and its i-th picture by the image file named by
+        the record's image_fields[i] field (None keeps the picture).
+        Clones share the prototype page until the presentation is
+        serialized.  Returns how many slides were added.
+        """
+        prototype = self.slides.pop()
+        prototype.finish_slide()
+        proto = SlidePrototype(self, prototype, image_fields)
+        count = 0
+        for record in records:
+            count += 1
+            pnum = len(self.slides) + 1
+            footer = None
+            if proto.footer is not None:
+                footer = ClonedFooter("ftr%d" % self._footer_count)
+                self._footer_count += 1
+            self.slides.append(ClonedSlide(self, proto, record, pnum, footer))
+        return count
+
     def add_footer(self, f):
         f.name = "ftr%d" % (self._footer_count)
         self._footer_count += 1
         self.slides[-1].footer = f
 
+    def page_entry(self, slides, created=()):
+        """
+        Serialize slides, which must have been rendered by to_xml, along
+        with the automatic styles and pictures they use so splice_pages
+        can add them to another presentation.  created are the styles
+        that were given new names while translating them (in order, see
+        RenderContext.name_log).  Returns None for slides that can't be
+        moved (imported slides).
+        """
+        pages = []
+        used_styles = set()
+        used_pictures = set()
+        for slide in slides:
+            if isinstance(slide, (XMLSlide, SkippedSlide)):
+                return None
+
+            page = {"xml": None, "footer": None}
+            # get_node isn't repeatable, to_xml already finished the page
+            nodes = [slide._page]
+            if slide.footer:
+                nodes.append(slide.footer.node)
+            for node in nodes:
+                used_styles.update(_style_refs(node))
+            used_pictures.update(picture_refs(nodes))
+            page["xml"] = to_xml(nodes[0]).decode("utf-8")
+            if len(nodes) > 1:
+                page["footer"] = to_xml(nodes[1]).decode("utf-8")
+            pages.append(page)
+
+        styles = [
+            to_xml(node).decode("utf-8")
+            for node in self._auto_styles
+            if node.get(ns("style", "name")) in used_styles
+        ]
+        pictures = []
+        for p in self._pictures:
+            if p.internal_name in used_pictures:
+                if not isinstance(p, Picture):
+                    return None
+
+                pictures.append([p.internal_name, p.filepath])
+        return {
+            "pages": pages,
+            "styles": styles,
+            "pictures": pictures,
+            "created": [[st.__class__.__name__, st.styles] for st in created],
+        }
+
+    def splice_pages(self, entry):
+        """
+        Append the pages of a page_entry as CachedSlides.  Styles,
+        pictures, ids, page and footer names are renamed so they fit in
+        with the rest of this presentation.
+        """
+        if self.slides:
+            self.slides[-1].finish_slide()
+        # replay name generation so numbering matches a build that
+        # translated the pages here (raw XML can use the generated names)
+        style_classes = dict((cls.__name__, cls) for cls in STYLE_CLASSES.values())
+        for class_name, styles in entry.get("created", ()):
+            style_classes[class_name](**styles)
+        # a LineStyle and a TextStyle can share a name, go by family too
+        present = set(_style_id(node) for node in self._auto_styles)
+        renames = {}  # map of (family, name) to the name here
+        for xml in entry["styles"]:
+            node = et.fromstring(xml.encode("utf-8"))
+            family, name = _style_id(node)
+            style = style_from_node(node)
+            if style is not None:
+                renames[family, name] = style.name
+                if (family, style.name) not in present:
+                    self.add_style(style)
+            elif (family, name) not in present:
+                # raw or list style, keep the name
+                self._styles_added[name] = 1
+                self._auto_styles.append(node)
+            present.add((family, renames.get((family, name), name)))
+
+        hrefs = {}
+        for internal_name, filepath in entry["pictures"]:
+            p = Picture(filepath)
+            self._pictures.append(p)
+            hrefs["Pictures/" + internal_name] = "Pictures/" + p.internal_name
+
+        for page in entry["pages"]:
+            pnum = len(self.slides) + 1
+            node = et.fromstring(page["xml"].encode("utf-8"))
+            footer = None
+            if page["footer"]:
+                footer = CachedFooter(
+                    "ftr%d" % self._footer_count,
+                    et.fromstring(page["footer"].encode("utf-8")),
+                )
+                self._footer_count += 1
+                node.set(ns("presentation", "use-footer-name"), footer.name)
+                footer.node.set(ns("presentation", "name"), footer.name)
+            node.set(ns("draw", "name"), "page%d" % pnum)
+            _rename_page(
+                [node] + ([footer.node] if footer else []), renames, hrefs, pnum
+            )
+            self.slides.append(CachedSlide(self, node, pnum, footer))
+
+
+PageEntry = collections.namedtuple(
+    "PageEntry", "name master_page_name start end namespaces"
+)
+
+# a start tag, attribute values can hold ">"
+START_TAG = re.compile(
+    rb"""<[^\s/>]+(?:\s+[^\s=]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>"""
+)
+
+
+class LazySlides(object):
+    """
+    Slides of a presentation read with Preso.from_file(path, lazy=True).
+    One expat pass indexes the pages of content.xml (name, master page,
+    byte range and the namespaces in scope, see pages).  A page's tree,
+    its Slide and the automatic styles it uses are only built when it is
+    accessed.
+    """
+
+    def __init__(self, preso, content):
+        self.preso = preso
+        self._content = content  # content.xml bytes
+        self.pages = []  # PageEntry of each draw:page
+        self._styles_entry = None  # PageEntry of office:automatic-styles
+        self._auto_styles = None  # map of name to style node, parsed on use
+        self._styles_loaded = set()
+        self._index()
+        self._slides = [None] * len(self.pages)
+
+    def _index(self):
+        from xml.parsers import expat
+
+        def expat_name(prefix, local):
+            # expat names are "uri local"
+            return ns(prefix, local)[1:].replace("}", " ")
+
+        page_tag = expat_name("draw", "page")
+        styles_tag = expat_name("office", "automatic-styles")
+        name_attr = expat_name("draw", "name")
+        master_attr = expat_name("draw", "master-page-name")
+        parser = expat.ParserCreate(namespace_separator=" ")
+        namespaces = [{}]  # prefixes in scope, copied when one is declared
+        open_ = []  # (tag, start offset, attributes, namespaces) of entries
+
+        def start_ns(prefix, uri):
+            scope = dict(namespaces[-1])
+            scope[prefix] = uri
+            namespaces.append(scope)
+
+        def end_ns(prefix):
+            namespaces.pop()
+
+        def start(tag, attrib):
+            if tag in (page_tag, styles_tag):
+                open_.append((tag, parser.CurrentByteIndex, attrib, namespaces[-1]))
+
+        def end(tag):
+            if not open_ or open_[-1][0] != tag:
+                return
+
+            tag, begin, attrib, scope = open_.pop()
+            offset = START_TAG.match(self._content, begin).end()
+            if self._content[offset - 2 : offset] != b"/>":
+                # not an empty element, expat is at its end tag
+                offset = self._content.index(b">", parser.CurrentByteIndex) + 1
+            entry = PageEntry(
+                attrib.get(name_attr), attrib.get(master_attr), begin, offset, scope
+            )
+            if tag == page_tag:
+                self.pages.append(entry)
+            elif self._styles_entry is None:
+                self._styles_entry = entry
+
+        parser.StartNamespaceDeclHandler = start_ns
+        parser.EndNamespaceDeclHandler = end_ns
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.Parse(self._content, True)
+
+    def _parse(self, entry, tag):
+        """ element for the part of content.xml entry indexes """
+        attrib = " ".join(
+            '{}="{}"'.format("xmlns:" + prefix if prefix else "xmlns", uri)
+            for prefix, uri in entry.namespaces.items()
+        )
+        data = (
+            "<root {}>".format(attrib).encode("utf-8")
+            + self._content[entry.start : entry.end]
+            + b"</root>"
+        )
+        node = et.fromstring(data)[0]
+        if node.tag != tag:
+            raise ValueError(
+                "content.xml index is wrong, found {} instead of {} at {}".format(
+                    node.tag, tag, entry.start
+                )
+            )
+        return node
+
+    def page_node(self, index):
+        """ new draw:page element of the page at index """
+        return self._parse(self.pages[index], ns("draw", "page"))
+
+    def load_styles(self, node):
+        """
+        add the automatic styles node (a page_node) uses, and the styles
+        they depend on, to the presentation
+        """
+        if self._auto_styles is None:
+            styles = None
+            if self._styles_entry is not None:
+                styles = self._parse(
+                    self._styles_entry, ns("office", "automatic-styles")
+                )
+            self._auto_styles = {}
+            for style in styles if styles is not None else []:
+                self._auto_styles[style.get(ns("style", "name"))] = style
+
+        todo = list(_style_refs(node))
+        while todo:
+            name = todo.pop()
+            if name in self._styles_loaded or name not in self._auto_styles:
+                continue
+
+            self._styles_loaded.add(name)
+            style = self._auto_styles[name]
+            self.preso.add_imported_auto_style(style)
+            todo.extend(_style_refs(style))
+
+    def __len__(self):
+        return len(self._slides)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        slide = self._slides[index]
+        if slide is None:
+            node = self.page_node(index)
+            self.load_styles(node)
+            slide = Slide.from_etree_node(self.preso, node, index + 1)
+            self._slides[index] = slide
+        return slide
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, slide):
+        self._slides.append(slide)
+
 
 class Animation(object):
+    __slots__ = ("id", "ids")
+
     ANIM_COUNT = 1
 
     def __init__(self, ids=None):
@@ -559,9 +1285,7 @@ class Animation(object):
         self.ids = ids
 
     def _get_id(self):
-        my_id = "id%d" % self.__class__.ANIM_COUNT
-        self.__class__.ANIM_COUNT += 1
-        return my_id
+        return current_context().next_anim_id()
 
     def get_node(self):
         """
@@ -625,6 +1349,8 @@ class ImportedPicture(object):
     Pictures used when importing slides
     """
 
+    __slots__ = ("internal_name", "data")
+
     def __init__(self, name, data):
         self.internal_name = name
         self.data = data
@@ -652,13 +1378,23 @@ class Picture(object):
                                        })
     """
 
+    __slots__ = ("filepath", "w", "h", "internal_name", "user_defined")
+
     COUNT = 0
     CM_SCALE = 30.0
 
     def __init__(self, filepath, **kw):
+        from PIL import Image
+
         self.filepath = filepath
-        image = Image.open(filepath)
-        self.w, self.h = image.size
+        context = current_context()
+        with context.span("load picture", "picture", path=filepath):
+            data = context.file_data.get(os.path.abspath(filepath))
+            if data is not None:
+                image = Image.open(Sio(data))
+            else:
+                image = Image.open(filepath)
+            self.w, self.h = image.size
         self.internal_name = self._gen_name()
         self.user_defined = {}
         self._process_kw(kw)
@@ -679,11 +1415,10 @@ class Picture(object):
 
     def _gen_name(self):
         ext = os.path.splitext(self.filepath)[1]
-        name = str(Picture.COUNT) + ext
-        Picture.COUNT += 1
-        return name
+        return str(current_context().next_picture_number()) + ext
 
     def get_xywh(self, measurement=None, slide=None):
+        context = current_context()
         if slide and slide.grid_w_h_x_y:
             frame_w, frame_h, frame_x, frame_y = [
                 int(float(x.replace("cm", ""))) for x in slide.grid_w_h_x_y
@@ -691,8 +1426,8 @@ class Picture(object):
         else:
             frame_x = 0
             frame_y = 0
-            frame_w = SLIDE_WIDTH
-            frame_h = SLIDE_HEIGHT
+            frame_w = context.slide_width
+            frame_h = context.slide_height
         if measurement is None or measurement == "cm":
             measurement = "cm"
             scale = Picture.CM_SCALE
@@ -714,7 +1449,7 @@ class Picture(object):
                 frame_w * DPCM, frame_h * DPCM, self.w, self.h
             )
         elif "fill" in classes:
-            x, y, w, h = 0, 0, SLIDE_WIDTH, SLIDE_HEIGHT
+            x, y, w, h = 0, 0, context.slide_width, context.slide_height
         elif "pad" in classes:
             # put 10% pad on sides
             x, y, w, h = imagescale.adjust_pad(
@@ -758,7 +1493,7 @@ class Picture(object):
         return str(self.h / scale)
 
     def get_data(self):
-        return open(self.filepath, "rb").read()
+        return current_context().read_file(self.filepath)
 
 
 class Slide(object):
@@ -792,6 +1527,7 @@ class Slide(object):
 
         self.insert_line_break = 0
         self.grid_w_h_x_y = None
+        self.finished = False  # finish_slide has built the final page
 
         # xml elements
         self._page = None
@@ -829,7 +1565,8 @@ class Slide(object):
         # add frames
         for child in master:
             if child.tag == ns("draw", "frame"):
-                self.add_text_frame(attrib=child.attrib)
+                # a copy, TextFrame adds a draw:id
+                self.add_text_frame(attrib=dict(child.attrib))
 
     @classmethod
     def from_etree_node(cls, preso, node, page_num):
@@ -839,7 +1576,7 @@ class Slide(object):
 
         for child in node:
             if child.tag == ns("draw", "frame"):
-                s.add_text_frame(attrib=child.attrib, props={})
+                s.add_text_frame(attrib=dict(child.attrib), props={})
         return s
 
     def _init_xml(self):
@@ -860,13 +1597,7 @@ class Slide(object):
         )
 
     def _add_raw_to_node(self, content, parent):
-        # need to add all those namespaces...
-        root = "<root {}>".format(
-            " ".join('{}="{}"'.format(k, v) for k, v in DOC_CONTENT_ATTRIB.items())
-        )
-        end_root = "</root>"
-        src = root + content + end_root
-        for child in et.fromstring(src).getchildren():
+        for child in parse_raw(content):
             parent.append(child)
 
     def raw(self, content):
@@ -953,18 +1684,153 @@ class Slide(object):
     def pop_style(self):
         self.pending_styles.pop()
 
-    def add_code(self, code, language):
+    def add_code(self, code, language, tokens=None):
+        """
+        Highlight code.  tokens can hold the output of lex_code for code
+        when it was tokenized ahead of time.
+        """
         if self.cur_element is None:
             self.add_text_frame()
-        style = ParagraphStyle(**{"fo:text-align": "start"})
-        self.push_style(style)
-        pygments.highlight(
-            code,
-            lexers.get_lexer_by_name(language, stripall=True),
-            OdtCodeFormatter(self.cur_element, self._preso, style=PYGMENTS_STYLE),
+        with current_context().span(
+            "highlight code", "highlight", language=language, chars=len(code)
+        ):
+            style = ParagraphStyle(**{"fo:text-align": "start"})
+            self.push_style(style)
+            cache = self._preso.code_cache
+            key = None
+            if cache is not None:
+                key = self._code_cache_key(cache, code, language)
+            if key is None or not self._graft_code(cache.get(key)):
+                import pygments.token
+
+                context = current_context()
+                anchor = self.cur_element.cur_node
+                start = len(anchor)
+                self._preso._style_log = []
+                outer_log = context.name_log
+                context.name_log = []
+                try:
+                    if tokens is None:
+                        source = get_lexer(language).get_tokens(code)
+                    else:
+                        source = [
+                            (pygments.token.string_to_tokentype(ttype), value)
+                            for ttype, value in tokens
+                        ]
+                    pygments.format(
+                        source,
+                        _formatter_class()(
+                            self.cur_element,
+                            self._preso,
+                            style=context.pygments_style,
+                        ),
+                    )
+                    if key is not None:
+                        entry = self._code_entry(
+                            anchor, start, context.name_log, self._preso._style_log
+                        )
+                        if entry:
+                            cache.put(key, entry)
+                finally:
+                    self._preso._style_log = None
+                    if outer_log is not None:
+                        outer_log.extend(context.name_log)
+                    context.name_log = outer_log
+            self.pop_style()
+            self.pop_node()
+
+    def _code_cache_key(self, cache, code, language):
+        """
+        Key for the code cache, or None when the output depends on state
+        that can't be captured (inside a paragraph or an animation)
+        """
+        if self.cur_element._in_p() or self.paragraph_attribs:
+            return None
+
+        context = [
+            sorted(self.cur_element.get_para_styles().items()),
+            sorted(self.cur_element.get_span_styles().items()),
+            [
+                (s.__class__.__name__, sorted(s.styles.items()))
+                for s in self.pending_styles
+            ],
+        ]
+        settings = current_context()
+        return cache.key(
+            code, language, settings.pygments_style, settings.mono_font, context
         )
-        self.pop_style()
-        self.pop_node()
+
+    def _code_entry(self, anchor, start, created, added):
+        """
+        Describe the nodes highlighting appended to anchor (from index
+        start) so they can be grafted back by _graft_code.  created are
+        the styles that were given new names (in order), added the
+        styles passed to Preso.add_style.
+        """
+        cursor = []
+        node = self.cur_element.cur_node
+        while node is not anchor:
+            parent = node.getparent()
+            if parent is None:
+                return None
+
+            cursor.insert(0, parent.index(node))
+            node = parent
+        if cursor:
+            if cursor[0] < start:
+                return None
+
+            cursor[0] -= start
+
+        seen = {}
+        for s in added:
+            seen.setdefault(s.name, [s.__class__.__name__, s.name, s.styles])
+        return {
+            "nodes": [to_xml(n).decode("utf-8") for n in anchor[start:]],
+            "created": [[s.__class__.__name__, s.styles] for s in created],
+            "styles": list(seen.values()),
+            "cursor": cursor,
+        }
+
+    def _graft_code(self, entry):
+        """
+        Append a cached highlighting entry to the current element,
+        registering its styles under the names this presentation uses.
+        Returns False if there is nothing to graft.
+        """
+        if not entry:
+            return False
+
+        style_classes = dict(
+            (cls.__name__, cls) for cls in (TextStyle, ParagraphStyle)
+        )
+        # replay name generation so numbering matches an uncached build
+        for class_name, styles in entry["created"]:
+            style_classes[class_name](**styles)
+        renames = {}
+        for class_name, name, styles in entry["styles"]:
+            style = style_classes[class_name](**styles)
+            self._preso.add_style(style)
+            renames[name] = style.name
+
+        anchor = self.cur_element.cur_node
+        start = len(anchor)
+        style_attr = ns("text", "style-name")
+        for xml in entry["nodes"]:
+            node = et.fromstring(xml.encode("utf-8"))
+            for child in node.iter():
+                name = child.get(style_attr)
+                if name in renames:
+                    child.set(style_attr, renames[name])
+            anchor.append(node)
+
+        node = anchor
+        for i, index in enumerate(entry["cursor"]):
+            node = node[start + index if i == 0 else index]
+        self.cur_element.cur_node = node
+        self.cur_element.dirty = True
+        self.insert_line_break = 0
+        return True
 
     def add_picture(self, p):
         """
@@ -1040,6 +1906,9 @@ class Slide(object):
 
     def get_node(self):
         """return etree Element representing this slide"""
+        if self.finished:
+            return self._page
+
         # already added title, text frames
         # add animation chunks
         if self.animations:
@@ -1141,6 +2010,440 @@ class Slide(object):
                 an = Animation(ids=ids)
                 node = an.get_node()
                 seq_node.append(node)
+        self._release()
+
+    def _release(self):
+        """
+        Build the final page and drop the frames, lists and animations
+        that wrote it.  Only the element tree (and the footer's) is kept
+        until the presentation is serialized.
+        """
+        if self.finished:
+            return
+
+        self._page = self.get_node()
+        if self.footer is not None and not isinstance(self.footer, CachedFooter):
+            self.footer = CachedFooter(self.footer.name, self.footer.get_node())
+        self.finished = True
+        self.title_frame = None
+        self.text_frames = []
+        self.pic_frame = None
+        self.notes_frame = None
+        self.bullet_list = None
+        self.cur_element = None
+        self.element_stack = []
+        self.animations = []
+        self.paragraph_attribs = {}
+        self.pending_styles = []
+        self.page_number_listeners = [self]
+        self.anim_ids = []
+
+
+class CachedSlide(Slide):
+    """
+    A finished page added by Preso.splice_pages.  Its xml is final, so
+    get_node and finish_slide leave it alone.
+    """
+
+    def __init__(self, preso, node, page_number, footer=None):
+        Slide.__init__(self, preso, page_number=page_number, init=False)
+        self._page = node
+        self.footer = footer
+
+    def get_node(self):
+        return self._page
+
+    def finish_slide(self):
+        pass
+
+
+class SkippedSlide(Slide):
+    """
+    Placeholder for a page excluded by limit_pages that was never
+    translated.  It isn't written out.
+    """
+
+    def __init__(self, preso, page_number):
+        Slide.__init__(self, preso, page_number=page_number, init=False)
+        self.footer = None
+
+    def finish_slide(self):
+        pass
+
+
+class CachedFooter(object):
+    """ footer-decl of a CachedSlide """
+
+    def __init__(self, name, node):
+        self.name = name
+        self.node = node
+
+    def get_node(self):
+        return self.node
+
+
+class SlidePrototype(object):
+    """
+    Finished page of a slide that Preso.generate_slides clones.  The
+    nodes that change per record (texts with fields, pictures, ids,
+    animation targets and page number fields) are located once up front,
+    a clone only writes to those; the rest of the page is copied as is.
+    """
+
+    FIELD = re.compile(r"\{(\w+)\}")
+
+    def __init__(self, preso, slide, image_fields=()):
+        self.preso = preso
+        self.node = slide.get_node()
+        self.footer = slide.footer.get_node() if slide.footer else None
+        self.texts = []  # (path, "text" or "tail", text with fields)
+        self.images = []  # (path, field)
+        self.ids = []  # (root, path, id attribute)
+        self.targets = []  # (root, path) of animation targets
+        self.page_numbers = []  # (root, path)
+        self._pictures = {}  # map of image path to Picture
+        image_fields = list(image_fields)
+        href = ns("xlink", "href")
+        id_attrs = (ns("draw", "id"), ns("text", "id"))
+        target = ns("smil", "targetElement")
+        page_num = ns("draw", "page-number")
+        replaced = set()
+        roots = [self.node] if self.footer is None else [self.node, self.footer]
+        for root, top in enumerate(roots):
+            for path, node in _walk(top):
+                if root == 0:
+                    for attr in ("text", "tail"):
+                        text = getattr(node, attr)
+                        if path and text and self.FIELD.search(text):
+                            self.texts.append((path, attr, text))
+                    if node.tag == ns("draw", "image") and image_fields:
+                        field = image_fields.pop(0)
+                        if field:
+                            self.images.append((path, field))
+                            replaced.add(node.get(href)[len("Pictures/") :])
+                for attr in id_attrs:
+                    if node.get(attr) is not None:
+                        self.ids.append((root, path, attr))
+                if node.get(target) is not None:
+                    self.targets.append((root, path))
+                if node.get(page_num) is not None:
+                    self.page_numbers.append((root, path))
+        # pictures only on the prototype aren't packaged
+        preso._pictures = [
+            p for p in preso._pictures if p.internal_name not in replaced
+        ]
+
+    def picture(self, path):
+        """ Picture for the image at path, added to the presentation once """
+        if path not in self._pictures:
+            p = Picture(path)
+            self.preso._pictures.append(p)
+            self._pictures[path] = p
+        return self._pictures[path]
+
+    def build(self, record, page_number, footer_name=None):
+        """ (page, footer) nodes of a copy for record """
+        page = copy.deepcopy(self.node)
+        roots = [page]
+        for path, attr, text in self.texts:
+            value = self.FIELD.sub(
+                lambda m: str(record.get(m.group(1), m.group(0))), text
+            )
+            setattr(_node_at(page, path), attr, value)
+        for path, field in self.images:
+            p = self.picture(record[field])
+            _node_at(page, path).set(ns("xlink", "href"), "Pictures/" + p.internal_name)
+        page.set(ns("draw", "name"), "page%d" % page_number)
+
+        footer = None
+        if self.footer is not None:
+            footer = copy.deepcopy(self.footer)
+            footer.set(ns("presentation", "name"), footer_name)
+            page.set(ns("presentation", "use-footer-name"), footer_name)
+            roots.append(footer)
+        # fresh ids and page number fields, like _rename_page
+        context = current_context()
+        ids = {}
+        for root, path, attr in self.ids:
+            node = _node_at(roots[root], path)
+            if attr == ns("draw", "id"):
+                ids[node.get(attr)] = context.next_draw_id()
+            else:
+                ids[node.get(attr)] = context.next_anim_id()
+            node.set(attr, ids[node.get(attr)])
+        target = ns("smil", "targetElement")
+        for root, path in self.targets:
+            node = _node_at(roots[root], path)
+            if node.get(target) in ids:
+                node.set(target, ids[node.get(target)])
+        for root, path in self.page_numbers:
+            _node_at(roots[root], path).set(
+                ns("draw", "page-number"), "%d" % page_number
+            )
+        return page, footer
+
+
+class ClonedSlide(Slide):
+    """
+    A page generated from a SlidePrototype for a record.  Until it is
+    serialized it only holds the record, its page is built by get_node.
+    """
+
+    def __init__(self, preso, prototype, record, page_number, footer=None):
+        Slide.__init__(self, preso, page_number=page_number, init=False)
+        self.prototype = prototype
+        self.record = record
+        self.footer = footer
+        self._page = None
+        if footer is not None:
+            footer.slide = self
+
+    def _build(self):
+        if self._page is None:
+            footer_name = self.footer.name if self.footer else None
+            self._page, footer = self.prototype.build(
+                self.record, self.page_number, footer_name
+            )
+            if footer is not None:
+                self.footer.node = footer
+
+    def get_node(self):
+        self._build()
+        return self._page
+
+    def finish_slide(self):
+        pass
+
+
+class ClonedFooter(CachedFooter):
+    """ footer-decl of a ClonedSlide, built along with its page """
+
+    def __init__(self, name):
+        CachedFooter.__init__(self, name, None)
+        self.slide = None
+
+    def get_node(self):
+        self.slide._build()
+        return self.node
+
+
+def _walk(node, path=()):
+    """ (path of child indexes, element) for node and its descendants """
+    yield path, node
+    for i, child in enumerate(node):
+        for item in _walk(child, path + (i,)):
+            yield item
+
+
+def _node_at(node, path):
+    for index in path:
+        node = node[index]
+    return node
+
+
+def _style_key(node, top=True):
+    """
+    Canonical form of a style node: its tag, attributes (but the style's
+    own name), text and children, ignoring attribute and child order
+    """
+    attrs = sorted(
+        (key, value)
+        for key, value in node.items()
+        if not (top and key == ns("style", "name"))
+    )
+    children = sorted(
+        _style_key(child, False) for child in node if isinstance(child.tag, str)
+    )
+    return (node.tag, tuple(attrs), (node.text or "").strip(), tuple(children))
+
+
+def _style_refs(node):
+    """ names of the styles node and its children refer to """
+    refs = set()
+    for child in node.iter():
+        for attr, value in child.items():
+            if attr.endswith("style-name"):
+                refs.add(value)
+            elif attr.endswith("class-names"):
+                refs.update(value.split())
+    return refs
+
+
+def normalize_text(node, plain_styles=()):
+    """
+    Merge and drop the text:span elements under node that don't change
+    how it renders: empty spans, spans continuing the previous span's
+    style, spans nested in a span with the same style and spans with a
+    style in plain_styles (that sets nothing).  Empty paragraphs are kept,
+    they render as blank lines.  Returns (elements removed, bytes saved).
+    """
+    span = ns("text", "span")
+    style_name = ns("text", "style-name")
+    removed = saved = 0
+    changed = True
+    while changed:
+        changed = False
+        # children before parents, so nested spans are merged first
+        for child in reversed(list(node.iter(span))):
+            if set(child.keys()) - set([style_name]):
+                # class names, ids
+                continue
+
+            parent = child.getparent()
+            prev = child.getprevious()
+            if (
+                prev is not None
+                and prev.tag == span
+                and prev.attrib == child.attrib
+                and not prev.tail
+            ):
+                saved += _tag_bytes(child)
+                _merge_into(prev, child)
+            elif (
+                (not child.text and len(child) == 0)
+                or child.get(style_name) in plain_styles
+                or (parent.tag == span and parent.attrib == child.attrib)
+            ):
+                saved += _tag_bytes(child)
+                _unwrap(child)
+            else:
+                continue
+
+            removed += 1
+            changed = True
+    return removed, saved
+
+
+def _add_text(parent, previous, text):
+    """ add text after previous (a child of parent) or at the start of parent """
+    if not text:
+        return
+
+    if previous is None:
+        parent.text = (parent.text or "") + text
+    else:
+        previous.tail = (previous.tail or "") + text
+
+
+def _unwrap(node):
+    """ replace node with its content """
+    parent = node.getparent()
+    previous = node.getprevious()
+    _add_text(parent, previous, node.text)
+    for child in list(node):
+        # moves the child's tail with it
+        node.addprevious(child)
+        previous = child
+    _add_text(parent, previous, node.tail)
+    parent.remove(node)
+
+
+def _merge_into(target, node):
+    """ move the content of node to the end of target, which it follows """
+    _add_text(target, target[-1] if len(target) else None, node.text)
+    for child in list(node):
+        target.append(child)
+    target.tail = node.tail
+    node.getparent().remove(node)
+
+
+def _tag_bytes(node):
+    """ bytes the tags of node take in the serialized xml """
+    prefixes = dict((uri, prefix) for prefix, uri in node.nsmap.items())
+
+    def qname(name):
+        name = et.QName(name)
+        if name.namespace:
+            return "{}:{}".format(prefixes[name.namespace], name.localname)
+        return name.localname
+
+    size = sum(
+        len(' {}="{}"'.format(qname(key), value)) for key, value in node.items()
+    )
+    if node.text or len(node):
+        return size + 2 * len(qname(node.tag)) + 5  # <x></x>
+    return size + len(qname(node.tag)) + 3  # <x/>
+
+
+def picture_refs(nodes):
+    """ internal names of the pictures nodes (and their children) use """
+    href = ns("xlink", "href")
+    used = set()
+    for node in nodes:
+        for child in node.iter():
+            value = child.get(href)
+            if value is not None and value.startswith("Pictures/"):
+                used.add(value[len("Pictures/") :])
+    return used
+
+
+def _style_id(node):
+    """ (family, name) of an automatic style node, family is None for list styles """
+    return node.get(ns("style", "family")), node.get(ns("style", "name"))
+
+
+def _ref_family(node, attr):
+    """
+    Family of the style the style-name attribute attr of node refers to
+    (style names are only unique within a family), None for list styles
+    """
+    tag = node.tag
+    if attr == ns("draw", "style-name"):
+        if tag in (ns("draw", "page"), ns("presentation", "notes")):
+            return "drawing-page"
+        return "graphic"
+    if attr == ns("draw", "text-style-name"):
+        return "paragraph"
+    if attr == ns("presentation", "style-name"):
+        return "presentation"
+    if attr == ns("text", "style-name"):
+        if tag in (ns("text", "p"), ns("text", "h")):
+            return "paragraph"
+        if tag == ns("text", "list"):
+            return None
+        return "text"
+    if attr == ns("table", "style-name"):
+        if tag == ns("table", "covered-table-cell"):
+            return "table-cell"
+        return tag.split("}")[1]
+    return None
+
+
+def _rename_page(nodes, style_names, hrefs, page_number):
+    """
+    Give the ids in a spliced page fresh values (so they are unique in
+    the presentation) and point style names (style_names maps (family,
+    name) to the new name) and picture references at their renamed
+    versions
+    """
+    draw_id = ns("draw", "id")
+    text_id = ns("text", "id")
+    target = ns("smil", "targetElement")
+    href = ns("xlink", "href")
+    page_num = ns("draw", "page-number")
+    context = current_context()
+    ids = {}
+    for node in nodes:
+        for child in node.iter():
+            if child.get(draw_id) is not None:
+                ids[child.get(draw_id)] = context.next_draw_id()
+                child.set(draw_id, ids[child.get(draw_id)])
+            if child.get(text_id) is not None:
+                ids[child.get(text_id)] = context.next_anim_id()
+                child.set(text_id, ids[child.get(text_id)])
+    for node in nodes:
+        for child in node.iter():
+            for key, value in child.items():
+                if key.endswith("style-name"):
+                    style = (_ref_family(child, key), value)
+                    if style in style_names:
+                        child.set(key, style_names[style])
+                elif key == target and value in ids:
+                    child.set(key, ids[value])
+                elif key == href and value in hrefs:
+                    child.set(key, hrefs[value])
+                elif key == page_num:
+                    child.set(key, "%d" % page_number)
 
 
 class XMLSlide(Slide):
@@ -1251,6 +2554,9 @@ class XMLSlide(Slide):
         return name
 
     def get_node(self):
+        if self.finished:
+            return self._page
+
         if self.notes_frame:
             notes = self.notes_frame.get_node()
             self._page.append(notes)
@@ -1262,6 +2568,16 @@ class MixedContent(object):
     An area that supports writing to
     """
 
+    # slotted, a large deck keeps thousands of these alive
+    __slots__ = (
+        "_default_align",
+        "slide",
+        "node",
+        "cur_node",
+        "pending_nodes",
+        "dirty",
+    )
+
     draw_id = 0
 
     def __init__(self, slide, name, attrib=None):
@@ -1269,8 +2585,7 @@ class MixedContent(object):
         self.slide = slide
         if attrib is None:
             attrib = {}
-        attrib["draw:id"] = "mc-{}".format(MixedContent.draw_id)
-        MixedContent.draw_id = MixedContent.draw_id + 1
+        attrib["draw:id"] = current_context().next_draw_id()
         self.node = el(name, attrib)
         self.cur_node = self.node
         # store nodes that affect output (such as text:a)
@@ -1511,6 +2826,8 @@ class MixedContent(object):
 
 
 class Footer(MixedContent):
+    __slots__ = ("name",)
+
     def __init__(self, slide):
         self._default_align = "center"
         MixedContent.__init__(self, slide, "presentation:footer-decl")
@@ -1520,11 +2837,13 @@ class Footer(MixedContent):
         if self.name is None:
             raise Exception("set footer name")
 
-        self.node.attrib["presentation:name"] = self.name
+        self.node.attrib[ns("presentation", "name")] = self.name
         return self.node
 
 
 class PictureFrame(MixedContent):
+    __slots__ = ()
+
     def __init__(self, slide, picture, attrib=None):
         x, y, w, h = picture.get_xywh(slide=slide)
         attrib = attrib or {
@@ -1541,6 +2860,8 @@ class PictureFrame(MixedContent):
 
 
 class TextFrame(MixedContent):
+    __slots__ = ("_text_box", "name")
+
     def __init__(self, slide, attrib=None, props=None, style_name=None):
         props = props if props is not None else slide.get_props("outline")
         attrib = attrib or {
@@ -1568,6 +2889,8 @@ class TextFrame(MixedContent):
 
 
 class TitleFrame(TextFrame):
+    __slots__ = ()
+
     def __init__(self, slide, attrib=None):
         props = slide.get_props("title")
         attrib = attrib or {
@@ -1591,6 +2914,8 @@ class TitleFrame(TextFrame):
 
 
 class NotesFrame(TextFrame):
+    __slots__ = ("_preso_notes", "_page_thumbnail")
+
     def __init__(self, slide, attrib=None):
         attrib = attrib or {
             "presentation:style-name": "pr1",
@@ -1668,10 +2993,12 @@ class TextStyle(object):
     text_rotation_angle = dict(ZERO="0", NINETY="90", TWOSEVENTY="270")
     text_rotation_scale = dict(LINE_HEIGHT="line-height", FIXED="fixed")
 
+    __slots__ = ("styles", "name")
+
     FAMILY = "text"
     STYLE_PROP = "style:text-properties"
     PREFIX = "T%d"
-    ATTRIB2NAME = {}
+    ATTRIB2NAME = {}  # registry of GLOBAL_CONTEXT
     PARENT_STYLE_DICT = {}
     TEXT_COUNT = 0
 
@@ -1679,22 +3006,14 @@ class TextStyle(object):
         """
         pass in a dictionary containing the style attributes you want for your text
         """
-        self.styles = kw
+        self.styles = current_context().intern_attrib(kw)
         self.name = self._gen_name()
 
     def __repr__(self):
         return "({} name:{} styles:{})".format(self.__class__, self.name, self.styles)
 
     def _gen_name(self):
-        key = sorted(self.styles.items())
-        key = tuple(key)
-        if key in self.__class__.ATTRIB2NAME:
-            return self.__class__.ATTRIB2NAME[key]
-
-        name = self.PREFIX % self.__class__.TEXT_COUNT
-        self.__class__.TEXT_COUNT += 1
-        self.__class__.ATTRIB2NAME[key] = name
-        return name
+        return current_context().style_name(self)
 
     def style_node(self, additional_style_attrib=None):
         """
@@ -1716,12 +3035,16 @@ class TextStyle(object):
 
 
 class LineStyle(TextStyle):
+    __slots__ = ()
+
     FAMILY = "graphic"
     STYLE_PROP = "style:graphic-properties"
     PARENT_STYLE_DICT = {"style:parent-style-name": "objectwithoutfill"}
 
 
 class ParagraphStyle(TextStyle):
+    __slots__ = ()
+
     text_align = dict(START="start", END="end", CENTER="center", JUSTIFY="justify")
     margin_left = None
     margin_right = None
@@ -1734,18 +3057,67 @@ class ParagraphStyle(TextStyle):
 
 
 class PageStyle(TextStyle):
+    __slots__ = ()
+
     FAMILY = "drawing-page"
     STYLE_PROP = "style:drawing-page-properties"
     PREFIX = "PS%d"
 
 
 class TextFrameStyle(TextStyle):
+    __slots__ = ()
+
     FAMILY = "presentation"
     STYLE_PROP = "style:graphic-properties"
     PREFIX = "TF%d"
 
 
-if PYGMENTS_FOUND:
+STYLE_CLASSES = dict(
+    (cls.FAMILY, cls)
+    for cls in (TextStyle, LineStyle, ParagraphStyle, PageStyle, TextFrameStyle)
+)
+
+
+def style_from_node(node):
+    """
+    Recreate the style that generated an automatic-style node, so its
+    name comes from this process' registry.  Returns None for nodes the
+    style classes didn't create (raw or list styles).
+    """
+    cls = STYLE_CLASSES.get(node.get(ns("style", "family")))
+    if cls is None or node.tag != ns("style", "style") or len(node) != 1:
+        return None
+
+    attrib = update_attrib(cls.PARENT_STYLE_DICT)
+    attrib[ns("style", "name")] = node.get(ns("style", "name"))
+    attrib[ns("style", "family")] = cls.FAMILY
+    props = node[0]
+    if dict(node.attrib) != attrib or props.tag != get_nstag(cls.STYLE_PROP):
+        return None
+
+    if len(props) or [k for k in props.keys() if not k.startswith("{")]:
+        return None
+
+    styles = {}
+    for key, value in props.items():
+        url, name = key[1:].split("}")
+        styles["{}:{}".format(NS2PREFIX[url], name)] = value
+    return cls(**styles)
+
+
+_FORMATTER_CLASS = []  # OdtCodeFormatter, defined on first use
+
+
+def _formatter_class():
+    """
+    Define OdtCodeFormatter.  It subclasses a pygments class, so this waits
+    until code is highlighted to import pygments.
+    """
+    if _FORMATTER_CLASS:
+        return _FORMATTER_CLASS[0]
+
+    import pygments.token
+    from pygments import formatter
 
     class OdtCodeFormatter(formatter.Formatter):
         def __init__(self, writable, preso, **options):
@@ -1792,7 +3164,7 @@ if PYGMENTS_FOUND:
             value = self.style.style_for_token(tokentype)
             # default to monospace
             results = {
-                "fo:font-family": MONO_FONT,
+                "fo:font-family": current_context().mono_font,
                 "style:font-family-generic": "swiss",
                 "style:font-pitch": "fixed",
             }
@@ -1810,6 +3182,17 @@ if PYGMENTS_FOUND:
                 results["fo:border"] = "#" + value["border"]
             return results
 
+    _FORMATTER_CLASS.append(OdtCodeFormatter)
+    return OdtCodeFormatter
+
+
+def __getattr__(name):
+    # keep preso.OdtCodeFormatter working without importing pygments early
+    if name == "OdtCodeFormatter" and PYGMENTS_FOUND:
+        return _formatter_class()
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
 
 class OutlineList(MixedContent):
     """
@@ -1862,6 +3245,8 @@ http://books.evc-cit.info/odbook/ch03.html#bulleted-numbered-lists-section
 	  </draw:text-box>
     """
 
+    __slots__ = ("attrib", "parents", "level", "style_file", "style_name")
+
     def __init__(self, slide, attrib=None):
         self._default_align = "start"
         self.attrib = attrib or {"text:style-name": "L2"}
@@ -1894,15 +3279,15 @@ http://books.evc-cit.info/odbook/ch03.html#bulleted-numbered-lists-section
         self.cur_node = self.parents[-1]
 
     def default_styles(self):
-        filename = os.path.join(DATA_DIR, self.style_file)
-        return open(filename).read()
+        return get_data_file(self.style_file).decode("utf-8")
 
     def default_styles_root(self):
-        filename = os.path.join(DATA_DIR, self.style_file)
-        return et.parse(filename).getroot()
+        return et.fromstring(get_data_file(self.style_file))
 
 
 class NumberList(OutlineList):
+    __slots__ = ()
+
     def __init__(self, slide):
         self.attrib = {"text:style-name": "L3"}
         OutlineList.__init__(self, slide, self.attrib)
@@ -1990,12 +3375,15 @@ class TableFrame(MixedContent):
 
     """
 
+    __slots__ = ("frame_attrib", "attrib", "table", "row")
+
     def __init__(self, slide, frame_attrib=None, table_attrib=None):
+        slide_width = current_context().slide_width
         self.frame_attrib = frame_attrib or {
             "draw:style-name": "standard",
             "draw:layer": "layout",
-            "svg:width": "%.2fcm" % (SLIDE_WIDTH * 0.84),
-            "svg:x": "%.2fcm" % ((SLIDE_WIDTH - (SLIDE_WIDTH * 0.84)) / 2),
+            "svg:width": "%.2fcm" % (slide_width * 0.84),
+            "svg:x": "%.2fcm" % ((slide_width - (slide_width * 0.84)) / 2),
             "svg:y": "1.2cm", #"147pt",
         }
         MixedContent.__init__(self, slide, "draw:frame", attrib=self.frame_attrib)
@@ -2026,6 +3414,128 @@ class TableFrame(MixedContent):
         self.add_node("table:table-cell", attrib)
 
 
+class TableBuilder(object):
+    """
+    Adds a large table in one pass: rows (sequences of cell texts) are
+    emitted straight into table:table-row elements with paragraph and
+    text styles computed once, rather than through add_cell and write.
+    Rows that don't fit go on continuation slides that repeat the title
+    and the header rows.
+    """
+
+    ROW_HEIGHT = 1.0  # cm, estimate used for the default rows_per_slide
+
+    def __init__(self, slide, header_rows=(), rows_per_slide=None, table_attrib=None):
+        self.slide = slide
+        self.preso = slide.preso
+        self.header_rows = list(header_rows)
+        self.table_attrib = table_attrib
+        if rows_per_slide is None:
+            height = current_context().slide_height - 2 * 1.2
+            rows_per_slide = max(
+                1, int(height / self.ROW_HEIGHT) - len(self.header_rows)
+            )
+        self.rows_per_slide = rows_per_slide
+
+        frame = TableFrame(slide, table_attrib=table_attrib)
+        para = ParagraphStyle(**frame.get_para_styles())
+        self.preso.add_style(para)
+        bold = TextStyle(**{"fo:font-weight": "bold"})
+        self.preso.add_style(bold)
+        self._row_attrib = {
+            ns("table", "style-name"): "ro1",
+            ns("table", "default-cell-style-name"): "ce1",
+        }
+        self._p_attrib = {ns("text", "style-name"): para.name}
+        self._header_span_attrib = {ns("text", "style-name"): bold.name}
+        self._frame = frame
+        self.slides = []
+
+    def add_rows(self, rows):
+        """
+        Add rows (any iterable, read once) to the table, returns the last
+        slide it went on
+        """
+        slide = self.slide
+        frame = self._frame
+        table = None
+        count = 0
+        for row in rows:
+            if table is None or count == self.rows_per_slide:
+                if table is not None:
+                    slide = self._continuation(slide)
+                    frame = TableFrame(slide, table_attrib=self.table_attrib)
+                table = self._start_table(slide, frame)
+                count = 0
+            self._add_row(table, row)
+            count += 1
+        if table is None and self.header_rows:
+            # no rows, still show the header
+            self._start_table(slide, frame)
+        return slide
+
+    def _start_table(self, slide, frame):
+        slide.add_table(frame)
+        slide.pop_element()
+        self.slides.append(slide)
+        for row in self.header_rows:
+            self._add_row(frame.table, row, self._header_span_attrib)
+        return frame.table
+
+    def _continuation(self, slide):
+        title = None
+        if slide.title_frame is not None:
+            title = "".join(slide.title_frame.get_node().itertext())
+        master_page_name = None
+        if self.preso.get_master_page(slide.master_page_name) is not None:
+            master_page_name = slide.master_page_name
+        new = self.preso.add_slide(master_page_name=master_page_name)
+        if title:
+            new.add_title_frame()
+            new.write(title)
+            new.cur_element = None
+        return new
+
+    def _add_row(self, table, row, span_attrib=None):
+        row_node = et.SubElement(table, ns("table", "table-row"), self._row_attrib)
+        for value in row:
+            cell = et.SubElement(row_node, ns("table", "table-cell"))
+            p = et.SubElement(cell, ns("text", "p"), self._p_attrib)
+            if span_attrib:
+                p = et.SubElement(p, ns("text", "span"), span_attrib)
+            _add_spaced_text(p, "" if value is None else "%s" % value)
+
+
+def _add_spaced_text(node, text):
+    """
+    Set text as the content of node, with runs of spaces written as
+    text:s (odp collapses them otherwise)
+    """
+    parts = re.split("( {2,})", text)
+    node.text = parts[0]
+    last = None
+    for i in range(1, len(parts), 2):
+        attrib = {}
+        if len(parts[i]) > 2:
+            attrib[ns("text", "c")] = str(len(parts[i]) - 1)
+        if last is None:
+            node.text += " "
+        else:
+            last.tail += " "
+        last = et.SubElement(node, ns("text", "s"), attrib)
+        last.tail = parts[i + 1]
+
+
+def csv_rows(path, encoding="utf-8", **kw):
+    """ iterator over the rows of a CSV file, read as they are used """
+    import csv
+    import io
+
+    with io.open(path, encoding=encoding, newline="") as fin:
+        for row in csv.reader(fin, **kw):
+            yield row
+
+
 class Template(object):
     def __init__(self, filepath=None):
         if filepath:
@@ -2035,10 +3545,20 @@ class Template(object):
         self.filepath = filepath
         self.zipfile = zipwrap.Zippier(filepath)
         self.styles = et.fromstring(self.zipfile.cat("styles.xml").encode("utf-8"))
-        self.content = et.fromstring(self.zipfile.cat("content.xml").encode("utf-8"))
+        self._content = None
+
+    @property
+    def content(self):
+        """ content.xml tree, parsed on first use """
+        if self._content is None:
+            self._content = et.fromstring(
+                self.zipfile.cat("content.xml").encode("utf-8")
+            )
+        return self._content
 
     def to_file(self, filename):
-        self.zipfile.close(filename)
+        """ write the template with its styles to filename (can be filepath) """
+        zipwrap.rewrite(self.filepath, filename, {"styles.xml": to_xml(self.styles)})
 
     def set_style_data(self, data):
         self.styles = et.fromstring(data)
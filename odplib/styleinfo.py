@@ -0,0 +1,258 @@
+"""
+Structured style inspection: the effective style chain of every text run
+on a set of slides, written as JSON lines.  Used by odpstyles --json.
+
+Pages come from Preso.from_file(path, lazy=True), so only the slides
+asked for are parsed.  A parent map of each page and an index of style
+names replace climbing the tree and searching the styles per text node.
+"""
+import json
+
+from odplib import preso
+
+ns = preso.ns
+
+# attributes naming a style, in the order they are looked at, and the
+# family of the style they name (None, depends on the element)
+STYLE_ATTRS = [
+    (ns("text", "style-name"), None),
+    (ns("presentation", "style-name"), "presentation"),
+    (ns("draw", "style-name"), None),
+    (ns("draw", "text-style-name"), "paragraph"),
+    (ns("table", "style-name"), None),
+]
+
+# family of the style named by text:style-name, draw:style-name and
+# table:style-name on these elements
+ELEMENT_FAMILIES = {
+    ns("text", "span"): "text",
+    ns("text", "a"): "text",
+    ns("text", "p"): "paragraph",
+    ns("text", "h"): "paragraph",
+    ns("text", "list"): "list",
+    ns("draw", "page"): "drawing-page",
+    ns("table", "table"): "table",
+    ns("table", "table-column"): "table-column",
+    ns("table", "table-row"): "table-row",
+    ns("table", "table-cell"): "table-cell",
+}
+
+# style elements without a style:family attribute
+TAG_FAMILIES = {
+    ns("text", "list-style"): "list",
+}
+
+
+def qname(name):
+    """ prefix:local for a {uri}local name """
+    if not name.startswith("{"):
+        return name
+
+    uri, local = name[1:].split("}")
+    prefix = preso.NS2PREFIX.get(uri)
+    return "{}:{}".format(prefix, local) if prefix else local
+
+
+def parse_slide_numbers(spec, count):
+    """
+    sorted slide numbers for a spec like "1,3,5-7" (all slides when
+    spec is empty).  Numbers past count are dropped.
+    """
+    if not spec:
+        return list(range(1, count + 1))
+
+    numbers = set()
+    for chunk in spec.split(","):
+        start, _, end = chunk.strip().partition("-")
+        numbers.update(range(int(start), int(end or start) + 1))
+    return sorted(n for n in numbers if 1 <= n <= count)
+
+
+def parent_map(node):
+    """ map of each element under node to its parent """
+    return dict((child, parent) for parent in node.iter() for child in parent)
+
+
+class StyleIndex(object):
+    """
+    Style name index over style containers (office:automatic-styles,
+    office:styles), earlier containers winning.  Resolves the parent
+    chain and the merged properties of a style, caching both.
+    """
+
+    def __init__(self, containers):
+        self.styles = {}  # map of (family, name) to style node
+        self.by_name = {}  # map of name to first style node with it
+        self.defaults = {}  # map of family to style:default-style node
+        self._properties = {}
+        for container in containers:
+            if container is None:
+                continue
+
+            for node in container:
+                family = node.get(ns("style", "family"), TAG_FAMILIES.get(node.tag))
+                if node.tag == ns("style", "default-style"):
+                    self.defaults.setdefault(family, node)
+                    continue
+
+                name = node.get(ns("style", "name"))
+                if name is None:
+                    continue
+
+                self.styles.setdefault((family, name), node)
+                self.by_name.setdefault(name, node)
+
+    def find(self, name, family=None):
+        """ style node named name (of family, when it has one) or None """
+        node = self.styles.get((family, name))
+        if node is None:
+            node = self.by_name.get(name)
+        return node
+
+    def chain(self, name, family=None):
+        """ names from name up its style:parent-style-name ancestors """
+        names = []
+        node = self.find(name, family)
+        while node is not None and name not in names:
+            names.append(name)
+            family = node.get(ns("style", "family"), family)
+            name = node.get(ns("style", "parent-style-name"))
+            node = self.find(name, family) if name else None
+        return names
+
+    def properties(self, name, family=None):
+        """
+        map of prefix:name to value for the properties of the style name,
+        its ancestors and the default style of its family, nearest first
+        """
+        key = (family, name)
+        if key not in self._properties:
+            props = {}
+            node = self.find(name, family)
+            if node is not None:
+                family = node.get(ns("style", "family"), family)
+            nodes = [self.find(n, family) for n in self.chain(name, family)]
+            nodes.append(self.defaults.get(family))
+            for node in reversed(nodes):
+                if node is None:
+                    continue
+
+                for child in node:
+                    if isinstance(child.tag, str) and child.tag.endswith(
+                        "-properties"
+                    ):
+                        for attr, value in child.items():
+                            props[qname(attr)] = value
+            self._properties[key] = props
+        return self._properties[key]
+
+
+def _element_styles(node):
+    """ (attribute, family, style name) of the styles node names """
+    for attr, family in STYLE_ATTRS:
+        name = node.get(attr)
+        if name:
+            if family is None:
+                family = ELEMENT_FAMILIES.get(node.tag)
+                if family is None and attr == ns("draw", "style-name"):
+                    family = "graphic"
+            yield attr, family, name
+
+
+def _runs(page):
+    """ (element owning the text, text) for each non blank text of page """
+    for node in page.iter():
+        if not isinstance(node.tag, str):
+            continue
+
+        if node.text and node.text.strip():
+            yield node, node.text
+        for child in node:
+            if child.tail and child.tail.strip():
+                yield node, child.tail
+
+
+def page_text_styles(page, index, slide_number=None):
+    """
+    dict for each text run of page: its text, the frame it is in, the
+    element path to it, the styles of the elements on that path
+    (outermost first) with their parent chains, and the effective
+    properties, inner styles overriding outer ones
+    """
+    parents = parent_map(page)
+    styles_of = {}  # styles an element names, shared by its runs
+    for owner, text in _runs(page):
+        ancestors = [owner]
+        while ancestors[-1] in parents:
+            ancestors.append(parents[ancestors[-1]])
+        ancestors.reverse()
+
+        frame = None
+        styles = []
+        effective = {}
+        for node in ancestors:
+            if node.tag == ns("draw", "frame"):
+                frame = node.get(ns("draw", "name"))
+            if node not in styles_of:
+                styles_of[node] = [
+                    {
+                        "element": qname(node.tag),
+                        "attribute": qname(attr),
+                        "family": family,
+                        "name": name,
+                        "chain": index.chain(name, family),
+                    }
+                    for attr, family, name in _element_styles(node)
+                ]
+            for style in styles_of[node]:
+                styles.append(style)
+                if style["family"] != "drawing-page":
+                    # page background, not text
+                    effective.update(
+                        index.properties(style["name"], style["family"])
+                    )
+
+        yield {
+            "slide": slide_number,
+            "page": page.get(ns("draw", "name")),
+            "master": page.get(ns("draw", "master-page-name")),
+            "frame": frame,
+            "path": [qname(node.tag) for node in ancestors],
+            "text": text,
+            "styles": styles,
+            "properties": effective,
+        }
+
+
+def slide_text_styles(path, spec=None):
+    """
+    page_text_styles records of the slides in spec (see
+    parse_slide_numbers) of the .odp at path
+    """
+    p = preso.Preso.from_file(path, lazy=True)
+    slides = p.slides
+    pages = []
+    for number in parse_slide_numbers(spec, len(slides)):
+        page = slides.page_node(number - 1)
+        # adds the automatic styles the page uses to p
+        slides.load_styles(page)
+        pages.append((number, page))
+
+    template_styles = p.template_files[0].styles
+    index = StyleIndex(
+        [
+            p.get_auto_styles(),
+            template_styles.find(ns("office", "automatic-styles")),
+            p.get_styles(),
+        ]
+    )
+    for number, page in pages:
+        for record in page_text_styles(page, index, number):
+            yield record
+
+
+def write_json_lines(records, fout):
+    """ write each record to fout as a line of JSON """
+    for record in records:
+        fout.write(json.dumps(record, sort_keys=True))
+        fout.write("\n")
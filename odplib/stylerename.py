@@ -0,0 +1,91 @@
+"""
+Batch style renaming for templates (otptweak --rename-style).
+
+All the old:new pairs are compiled into one longest-prefix lookup and
+every reference in styles.xml is rewritten in a single pass over the
+tree.  Only styles.xml is written again, the other members of the
+archive are copied as their raw compressed bytes.
+"""
+import os
+import re
+
+from odplib import preso, zipwrap
+
+ns = preso.ns
+
+# attributes holding a style name or a reference to one
+RENAME_ATTRS = [
+    ns("style", "name"),
+    ns("style", "parent-style-name"),
+    ns("presentation", "style-name"),
+]
+
+
+def parse_renames(fromto, template_name=None):
+    """
+    list of (old, new) for "old:new[,old2:new2]".  A non zero number old
+    is prefixed with template_name (template1 for 1 in template.otp).
+    """
+    renames = []
+    for chunk in fromto.split(","):
+        from_, to_ = chunk.split(":")
+        if template_name and from_.isdigit() and int(from_):
+            from_ = "{}{}".format(template_name, from_)
+        renames.append((from_, to_))
+    return renames
+
+
+class StyleRenamer(object):
+    """
+    Renames style names starting with an old prefix to start with its
+    new one.  When old prefixes overlap the longest one wins.
+    """
+
+    def __init__(self, renames, attrs=RENAME_ATTRS):
+        self.renames = dict(renames)
+        self.attrs = attrs
+        prefixes = sorted(self.renames, key=len, reverse=True)
+        self._match = re.compile("|".join(re.escape(p) for p in prefixes)).match
+
+    def rename_value(self, value):
+        match = self._match(value)
+        if match is None:
+            return value
+
+        return self.renames[match.group()] + value[match.end() :]
+
+    def rename(self, root):
+        """ rewrite the references under root, returns how many changed """
+        changed = 0
+        for node in root.iter():
+            for attr in self.attrs:
+                value = node.get(attr)
+                if value:
+                    new_value = self.rename_value(value)
+                    if new_value != value:
+                        node.set(attr, new_value)
+                        changed += 1
+        return changed
+
+
+def rename_template(path, fromto, add_prefix=True, dest=None):
+    """
+    Apply the renames in fromto (see parse_renames) to the template at
+    path, writing it to dest (default path).  Old names must be master
+    pages of the template.  Returns how many references changed.
+    """
+    t = preso.Template(path)
+    template_name = None
+    if add_prefix:
+        template_name = os.path.basename(path).split(".")[0]
+    renames = parse_renames(fromto, template_name)
+    page_names = set(t.get_master_page_names())
+    for from_, to_ in renames:
+        if from_ not in page_names:
+            raise Exception(
+                "{} not found in python styles: {}".format(from_, str(list(page_names)))
+            )
+
+    changed = StyleRenamer(renames).rename(t.styles)
+    t.to_file(dest or path)
+    return changed
@@ -0,0 +1,179 @@
+"""
+Timed spans of a build written as Chrome trace-event JSON, which
+chrome://tracing and https://ui.perfetto.dev can load.
+
+>>> tracer = Tracer()
+>>> with tracer.span("to_xml", "serialize"):
+...     pass
+>>> [(e["name"], e["cat"], e["ph"]) for e in tracer.events]
+[('to_xml', 'serialize', 'X')]
+"""
+import json
+import os
+import threading
+import time
+
+
+class Span(object):
+    """
+    One timed span, use it as a context manager or call start and stop
+    when the end is in another method (visit/depart)
+    """
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.begin = None
+
+    def start(self):
+        if self.tracer.memory:
+            self.tracer._push_peak()
+        self.begin = time.perf_counter()
+        return self
+
+    def stop(self, **args):
+        end = time.perf_counter()
+        self.args.update(args)
+        if self.tracer.memory:
+            self.args["memory_current"], self.args["memory_peak"] = (
+                self.tracer._pop_peak()
+            )
+        self.tracer.add(self.name, self.category, self.begin, end, self.args)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class NullSpan(object):
+    """ Span that records nothing, used when tracing is off """
+
+    def start(self):
+        return self
+
+    def stop(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    """
+    Collects complete ("X") trace events, safe to share between threads.
+    With memory=True tracemalloc runs and every span also records the
+    traced memory at its end and the peak during it (in bytes).  The
+    open spans are tracked per thread, but tracemalloc's peak is process
+    wide, so only trace memory of one build at a time.  The peak during
+    a span needs tracemalloc.reset_peak (Python 3.9), before that it is
+    the peak since tracing started.
+    """
+
+    def __init__(self, memory=False):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stacks = []  # the peak stack of each thread
+        self._started_tracemalloc = False
+        self._reset_peak = None
+        if memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+    def _peaks(self):
+        """ peak seen so far in each open span of this thread """
+        peaks = getattr(self._local, "peaks", None)
+        if peaks is None:
+            peaks = self._local.peaks = [0]
+            with self._lock:
+                self._stacks.append(peaks)
+        return peaks
+
+    def _push_peak(self):
+        import tracemalloc
+
+        peaks = self._peaks()
+        # fold the peak so far into the enclosing span before resetting it
+        peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        if self._reset_peak is not None:
+            self._reset_peak()
+        peaks.append(0)
+
+    def _pop_peak(self):
+        import tracemalloc
+
+        peaks = self._peaks()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peaks.pop(), peak)
+        if self._reset_peak is not None:
+            self._reset_peak()
+        peaks[-1] = max(peaks[-1], peak)
+        return current, peak
+
+    def memory_peak(self):
+        """ peak traced memory since tracing started """
+        import tracemalloc
+
+        with self._lock:
+            peak = max([peaks[0] for peaks in self._stacks] or [0])
+        return max(peak, tracemalloc.get_traced_memory()[1])
+
+    def stop_memory(self):
+        """ stop tracemalloc if this tracer started it """
+        if self._started_tracemalloc:
+            import tracemalloc
+
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def span(self, name, category="build", **args):
+        return Span(self, name, category, args)
+
+    def add(self, name, category, begin, end, args=None):
+        """ record a span from perf_counter values begin to end """
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (begin - self.origin) * 1e6,
+            "dur": (end - begin) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.current_thread().ident,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def to_json(self):
+        return json.dumps({"traceEvents": self.events, "displayTimeUnit": "ms"})
+
+    def write(self, path):
+        with open(path, "w") as fout:
+            fout.write(self.to_json())
+
+
+def _test():
+    import doctest
+
+    doctest.testmod()
+
+
+if __name__ == "__main__":
+    _test()
@@ -38,8 +38,10 @@ b'stuff'
 >>> os.remove("test/foo.zip")
 
 """
+import copy
+import struct
 import zipfile
-import tempfile
+import zlib
 import os
 import shutil
 
@@ -86,6 +88,21 @@ class Zippier:
         if fin:
             self.z.writestr(location, fin.read())
 
+    def write_deflated(self, location, payload, crc, size):
+        """
+        Add location from payload, its content already deflated (raw,
+        no zlib header), with the crc and size of the content
+        """
+        import time
+
+        zinfo = zipfile.ZipInfo(clean_path(location), time.localtime()[:6])
+        zinfo.external_attr = 0o600 << 16
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.CRC = crc
+        zinfo.file_size = size
+        zinfo.compress_size = len(payload)
+        write_raw(self.z, zinfo, payload)
+
     def mkdir(self, location):
         location = clean_path(location)
         if not location.endswith("/"):
@@ -113,6 +130,8 @@ class ZipWrap(object):
             if not os.path.exists(full_path):
                 raise IOError("File {} missing".format(path))
 
+        import tempfile
+
         self.path = path
         self.src_dir = tempfile.mkdtemp()
         self.cleanup = True
@@ -260,6 +279,151 @@ class ZipWrap(object):
             zout.write(f, new_path)
 
 
+# private ZipFile attributes reading and writing members as their raw
+# bytes depends on
+RAW_ATTRS = ("fp", "filelist", "NameToInfo", "start_dir", "_didModify")
+
+
+def raw_access(zfile):
+    """
+    Can members of the ZipFile zfile be read and written as their raw
+    (compressed) bytes.  That uses zipfile internals, without them
+    read_raw, write_raw and copy_member inflate and deflate instead.
+    """
+    return (
+        hasattr(zipfile, "sizeFileHeader")
+        and hasattr(zipfile.ZipInfo, "FileHeader")
+        and all(hasattr(zfile, attr) for attr in RAW_ATTRS)
+        and zfile.fp is not None
+    )
+
+
+def _deflate(data):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def read_raw(zin, info):
+    """ the raw (compressed) bytes of member info of the ZipFile zin """
+    if not raw_access(zin):
+        data = zin.read(info)
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = _deflate(data)
+        return data
+
+    zin.fp.seek(info.header_offset)
+    header = zin.fp.read(zipfile.sizeFileHeader)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    zin.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+    return zin.fp.read(info.compress_size)
+
+
+def copy_member(zin, zout, info):
+    """
+    Copy member info of the ZipFile zin to zout as its raw (compressed)
+    bytes, without inflating and deflating it again.
+    """
+    new = copy.copy(info)
+    if not (raw_access(zin) and raw_access(zout)):
+        zout.writestr(new, zin.read(info))
+        return
+
+    data = read_raw(zin, info)
+    # sizes and crc go in the local header, not a data descriptor
+    new.flag_bits &= ~0x08
+    write_raw(zout, new, data)
+
+
+def write_raw(zout, info, data):
+    """
+    Add a member to the ZipFile zout whose data is already compressed
+    the way info says (compress_type, CRC, file_size, compress_size)
+    """
+    if not raw_access(zout):
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        elif info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(
+                "can't write {} compressed with {}".format(
+                    info.filename, info.compress_type
+                )
+            )
+        zout.writestr(info, data)
+        return
+
+    info.header_offset = zout.fp.tell()
+    zout.fp.write(info.FileHeader())
+    zout.fp.write(data)
+    zout.filelist.append(info)
+    zout.NameToInfo[info.filename] = info
+    zout.start_dir = zout.fp.tell()
+    zout._didModify = True
+
+
+class MemberIndex(object):
+    """
+    The deflated members of an existing zip indexed by the crc and size
+    of their content, so a new version of the archive can copy the
+    compressed bytes of members that didn't change (even renamed ones)
+    instead of compressing them again.
+    """
+
+    def __init__(self, path):
+        self.z = zipfile.ZipFile(path)
+        self.reused = 0  # how many lookups found their member
+        self._by_content = {}
+        for info in self.z.infolist():
+            if info.compress_type == zipfile.ZIP_DEFLATED and not info.is_dir():
+                self._by_content.setdefault((info.CRC, info.file_size), info)
+
+    def get(self, data):
+        """
+        (payload, crc, size) of the member holding data (bytes), or None
+        when no member does
+        """
+        crc = zlib.crc32(data) & 0xFFFFFFFF
+        info = self._by_content.get((crc, len(data)))
+        if info is None:
+            return None
+
+        payload = read_raw(self.z, info)
+        # crc and size alone could collide, inflating is cheap next to
+        # deflating again
+        if zlib.decompress(payload, -15) != data:
+            return None
+
+        self.reused += 1
+        return payload, crc, len(data)
+
+    def close(self):
+        self.z.close()
+
+
+def rewrite(src, dest, members):
+    """
+    Write the zip at src to dest (which can be src) with the contents of
+    the members in the map of name to bytes replaced.  The other members
+    are copied raw, in their original order.
+    """
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(dest))
+    fd, tmp = tempfile.mkstemp(suffix=".zip", dir=directory)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(src) as zin:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    if info.filename in members:
+                        zout.writestr(copy.copy(info), members[info.filename])
+                    else:
+                        copy_member(zin, zout, info)
+        os.replace(tmp, dest)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
 def _test():
     import doctest
 
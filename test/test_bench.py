@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from bench import compare, e2e, micro
+from bench.generate import generate
+
+
+class TestBench(unittest.TestCase):
+    def test_generate(self):
+        rst = generate(slides=10, bullet_depth=3, tables=2, code_blocks=3)
+        self.assertEqual(rst.count("\nSlide "), 10)
+        self.assertEqual(rst.count(".. code-block:: python"), 3)
+        self.assertEqual(rst.count("| Name     | Value    |"), 2)
+        self.assertTrue("    * point 2.1 on slide 9" in rst)
+
+    def test_compare(self):
+        baseline = {"a": {"min": 1.0}, "b": {"min": 2.0}, "old": {"min": 1.0}}
+        current = {"a": {"min": 1.05}, "b": {"min": 3.0}, "new": {"min": 1.0}}
+        rows, regressions = compare.compare(baseline, current, threshold=0.1)
+        self.assertEqual([row[0] for row in rows], ["a", "b"])
+        self.assertEqual(regressions, ["b"])
+
+    def test_micro(self):
+        results = micro.run(scale=0.01)
+        self.assertTrue("micro.MixedContent.write" in results)
+        for result in results.values():
+            self.assertEqual(len(result["runs"]), 1)
+            self.assertTrue(result["min"] >= 0)
+
+    def test_e2e(self):
+        decks = [
+            ("small", dict(slides=3, tables=1, code_blocks=1, images=1, imports=1))
+        ]
+        saved, e2e.DECKS = e2e.DECKS, decks
+        cwd = os.getcwd()
+        # import: paths don't depend on the working directory
+        other = tempfile.mkdtemp()
+        os.chdir(other)
+        try:
+            results = e2e.run(repeat=1)
+        finally:
+            os.chdir(cwd)
+            e2e.DECKS = saved
+            shutil.rmtree(other)
+        self.assertEqual(list(results), ["e2e.small"])
+        self.assertEqual(len(results["e2e.small"]["runs"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+import unittest
+
+from odplib import cache, preso
+
+CODE = """def foo(a,  b):
+    return a + b  # add
+"""
+
+
+class TestCodeCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        # style names are process global, don't leak ours into other tests
+        self.attrib2name = dict(preso.TextStyle.ATTRIB2NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        preso.TextStyle.ATTRIB2NAME.clear()
+        preso.TextStyle.ATTRIB2NAME.update(self.attrib2name)
+
+    def _render(self, code_cache):
+        preso.MixedContent.draw_id = 0
+        p = preso.Preso()
+        p.code_cache = code_cache
+        s = p.add_slide()
+        s.write("before")
+        s.parent_of(preso.ns("text", "p"))
+        s.add_code(CODE, "python")
+        s.write("after")
+        return p.to_xml()
+
+    def test_hit_matches_highlighting(self):
+        uncached = self._render(None)
+        code_cache = cache.CodeCache(self.dir)
+        miss = self._render(code_cache)
+        # fresh instance so the entry comes from disk
+        hit = self._render(cache.CodeCache(self.dir))
+        self.assertEqual(uncached, miss)
+        self.assertEqual(miss, hit)
+
+    def test_key_includes_context(self):
+        code_cache = cache.CodeCache(self.dir)
+        p = preso.Preso()
+        s = p.add_slide()
+        s.add_text_frame()
+        plain = s._code_cache_key(code_cache, CODE, "python")
+        s.push_style(preso.TextStyle(**{"fo:font-size": "28pt"}))
+        sized = s._code_cache_key(code_cache, CODE, "python")
+        self.assertNotEqual(plain, sized)
+        s.write("in a paragraph")
+        self.assertEqual(s._code_cache_key(code_cache, CODE, "python"), None)
+
+
+class TestMemberCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cached_members_match(self):
+        import os
+        import zipfile
+
+        member_cache = cache.MemberCache(os.path.join(self.dir, "members"))
+        contents = []
+        for i in range(2):
+            with preso.RenderContext():
+                p = preso.Preso()
+                p.add_slide().write("hello")
+                p.member_cache = member_cache
+                path = os.path.join(self.dir, "out{}.odp".format(i))
+                p.to_file(path).close()
+            with zipfile.ZipFile(path) as z:
+                self.assertIsNone(z.testzip())
+                contents.append(dict((n, z.read(n)) for n in z.namelist()))
+            # later builds are served from the entry files
+            member_cache._memory.clear()
+        self.assertEqual(contents[0]["styles.xml"], contents[1]["styles.xml"])
+        self.assertIn(b"hello", contents[1]["content.xml"])
+
+        payload, crc, size = member_cache.get(contents[0]["settings.xml"])
+        self.assertEqual(size, len(contents[0]["settings.xml"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
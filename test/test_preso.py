@@ -1,3 +1,5 @@
+import re
+
 import preso
 
 
@@ -18,3 +20,271 @@ def test_add_cell():
     assert h == "{:.1f}cm".format(height)
     assert w == "{:.1f}cm".format(width - margin*2)
 
+
+def test_add_code_with_tokens():
+    # style names are process global, don't leak ours into other tests
+    saved = dict(preso.TextStyle.ATTRIB2NAME)
+    code = "for x in range(3):\n    print(x)"
+    try:
+        results = []
+        for tokens in [None, preso.lex_code(code, "python")]:
+            preso.MixedContent.draw_id = 0
+            p = preso.Preso()
+            p.add_slide().add_code(code, "python", tokens=tokens)
+            results.append(p.to_xml())
+        assert results[0] == results[1]
+    finally:
+        preso.TextStyle.ATTRIB2NAME.clear()
+        preso.TextStyle.ATTRIB2NAME.update(saved)
+
+
+def test_splice_pages():
+    saved = dict(preso.TextStyle.ATTRIB2NAME)
+    try:
+        p = preso.Preso()
+        s = p.add_slide()
+        s.push_style(preso.TextStyle(**{"fo:color": "#123456"}))
+        s.write("cached")
+        s.pop_style()
+        p.add_slide().write("last")
+        p.to_xml()
+        entry = p.page_entry(p.slides[:1])
+
+        p2 = preso.Preso()
+        p2.add_slide().write("first")
+        p2.splice_pages(entry)
+        xml = p2.to_xml().decode("utf-8")
+        assert 'draw:name="page2"' in xml
+        assert "cached" in xml
+        assert 'fo:color="#123456"' in xml
+        assert len(set(re.findall('draw:id="(mc-[0-9]+)"', xml))) == len(
+            re.findall('draw:id="', xml)
+        )
+    finally:
+        preso.TextStyle.ATTRIB2NAME.clear()
+        preso.TextStyle.ATTRIB2NAME.update(saved)
+
+
+def test_reset_registries():
+    saved = dict(preso.TextStyle.ATTRIB2NAME)
+    try:
+        results = []
+        for i in range(2):
+            preso.reset_registries()
+            p = preso.Preso()
+            s = p.add_slide()
+            s.update_style({"draw:fill-color": "#000000"})
+            s.add_code("x = 1", "python")
+            results.append(p.to_xml())
+        assert results[0] == results[1]
+    finally:
+        preso.TextStyle.ATTRIB2NAME.clear()
+        preso.TextStyle.ATTRIB2NAME.update(saved)
+
+
+def test_dedupe_auto_styles():
+    with preso.RenderContext():
+        p = preso.Preso()
+        for i in range(2):
+            p.add_slide().update_style({"draw:fill-color": "#000000"})
+        p.add_style(preso.TextStyle(**{"fo:color": "#abcdef"}))
+        xml = p.to_xml().decode("utf-8")
+        names = re.findall('draw:style-name="([^"]+)"', xml)
+        assert len(names) == 2 and names[0] == names[1]
+        assert xml.count('draw:fill-color="#000000"') == 1
+        # unused styles are pruned
+        assert "#abcdef" not in xml
+
+
+def test_normalize_text():
+    p = preso.parse_raw(
+        "<text:p>"
+        '<text:span text:style-name="T1">a</text:span>'
+        '<text:span text:style-name="T1">b<text:s/></text:span>'
+        '<text:span text:style-name="T2"/>tail '
+        '<text:span text:style-name="T3">c'
+        '<text:span text:style-name="T3">d</text:span>e</text:span>'
+        '<text:span text:style-name="T4">f</text:span>'
+        "</text:p>"
+    )[0]
+    before = len(preso.to_xml(p))
+    removed, saved = preso.normalize_text(p, plain_styles=set(["T4"]))
+    xml = preso.to_xml(p).decode("utf-8")
+    assert xml.endswith(
+        '<text:span text:style-name="T1">ab<text:s/></text:span>tail '
+        '<text:span text:style-name="T3">cde</text:span>f</text:p>'
+    )
+    assert removed == 4
+    assert saved == before - len(xml.encode("utf-8"))
+
+
+def test_from_file_lazy(tmp_path):
+    with preso.RenderContext():
+        p = preso.Preso()
+        for i in range(3):
+            s = p.add_slide()
+            s.push_style(preso.TextStyle(**{"fo:color": "#00000{}".format(i)}))
+            s.write("slide {}".format(i))
+            s.pop_style()
+        path = str(tmp_path / "deck.odp")
+        p.to_file(path)
+
+    with preso.RenderContext():
+        lazy = preso.Preso.from_file(path, lazy=True)
+        assert len(lazy.slides) == 3
+        assert [e.name for e in lazy.slides.pages] == ["page1", "page2", "page3"]
+        assert lazy.slides._slides.count(None) == 3
+        slide = lazy.slides[-1]
+        assert lazy.slides._slides.count(None) == 2
+        assert "slide 2" in preso.to_xml(slide._page).decode("utf-8")
+        # only the styles of the pages accessed are loaded
+        styles = preso.to_xml(lazy._auto_styles).decode("utf-8")
+        assert "#000002" in styles and "#000000" not in styles
+        assert "slide 0" in lazy.to_xml().decode("utf-8")
+
+    with preso.RenderContext():
+        eager = preso.Preso.from_file(path)
+        assert len(eager.slides) == 3
+
+
+def test_from_file_lazy_markup(tmp_path):
+    from odplib import zipwrap
+
+    with preso.RenderContext():
+        p = preso.Preso()
+        p.add_slide().write("first")
+        p.add_slide().write("second")
+        path = str(tmp_path / "deck.odp")
+        p.to_file(path).close()
+    content = zipwrap.Zippier(path).cat("content.xml", True)
+    # markup a text search for the page tags gets wrong
+    content = content.replace(
+        b"<draw:page ", b'<!-- <draw:page draw:name="no"> --><draw:page ', 1
+    )
+    content = content.replace(b"second", b"second<![CDATA[</draw:page>]]>")
+    content = content.replace(
+        b"</office:presentation>",
+        b'<draw:page draw:name="empty" draw:style-name="a>b"/></office:presentation>',
+    )
+    zipwrap.rewrite(path, path, {"content.xml": content})
+
+    with preso.RenderContext():
+        lazy = preso.Preso.from_file(path, lazy=True)
+        assert [e.name for e in lazy.slides.pages] == ["page1", "page2", "empty"]
+        assert "".join(lazy.slides.page_node(1).itertext()) == "second</draw:page>"
+        empty = lazy.slides.page_node(2)
+        assert len(empty) == 0 and empty.get(preso.ns("draw", "style-name")) == "a>b"
+
+
+def test_generate_slides():
+    with preso.RenderContext():
+        p = preso.Preso()
+        p.add_slide().write("first")
+        p.add_slide().write("Hello {name}, {missing}")
+        count = p.generate_slides(iter([{"name": "Ann"}, {"name": "Bob"}]))
+        assert count == 2 and len(p.slides) == 3
+        # clones are built when serialized
+        assert p.slides[1]._page is None
+        p.add_slide().write("last")
+        xml = p.to_xml().decode("utf-8")
+        assert "Hello Ann, {missing}" in xml and "Hello Bob" in xml
+        assert "{name}" not in xml
+        assert re.findall('draw:name="(page[0-9]+)"', xml) == [
+            "page1",
+            "page2",
+            "page3",
+            "page4",
+        ]
+        ids = re.findall('draw:id="([^"]+)"', xml)
+        assert len(set(ids)) == len(ids)
+
+
+def test_table_builder():
+    with preso.RenderContext():
+        p = preso.Preso()
+        s = p.add_slide()
+        s.add_title_frame()
+        s.write("Numbers")
+        builder = preso.TableBuilder(
+            s, header_rows=[["n", "square"]], rows_per_slide=4
+        )
+        last = builder.add_rows([i, i * i] for i in range(10))
+        assert len(builder.slides) == 3 and last is p.slides[-1]
+        xml = p.to_xml().decode("utf-8")
+        assert xml.count("<table:table-row") == 10 + 3
+        assert xml.count(">Numbers<") == 3
+        assert ">square</text:span>" in xml and ">81</text:p>" in xml
+
+
+def test_add_spaced_text():
+    p = preso.el("text:p")
+    preso._add_spaced_text(p, "a  b   c")
+    assert preso.to_xml(p).decode("utf-8").endswith(
+        '>a <text:s/>b <text:s text:c="2"/>c</text:p>'
+    )
+
+
+def test_parse_raw_cache():
+    raw = '<draw:rect svg:width="1cm"/><text:p>hi</text:p>'
+    first = preso.parse_raw(raw)
+    assert raw in preso._RAW_FRAGMENTS
+    first[0].set(preso.ns("svg", "width"), "2cm")
+    second = preso.parse_raw(raw)
+    # each use gets its own nodes
+    assert second[0] is not first[0]
+    assert second[0].get(preso.ns("svg", "width")) == "1cm"
+    assert [preso.to_xml(n) for n in second[1:]] == [preso.to_xml(first[1])]
+
+
+def test_finish_slide_releases_frames():
+    with preso.RenderContext():
+        p = preso.Preso()
+        s = p.add_slide()
+        s.add_title_frame()
+        s.write("title")
+        s.add_notes_frame()
+        s.write("a note")
+        f = preso.Footer(s)
+        f.write("footer")
+        p.add_footer(f)
+        p.add_slide().write("last")
+        assert s.finished
+        assert s.title_frame is None and s.notes_frame is None
+        assert s.cur_element is None and s.text_frames == []
+        assert s.footer.name == "ftr0"
+        assert not hasattr(f, "__dict__")
+        xml = p.to_xml().decode("utf-8")
+        assert xml.count("a note") == 1 and "footer" in xml
+        assert 'presentation:use-footer-name="ftr0"' in xml
+
+
+def test_intern_style_attrib():
+    with preso.RenderContext():
+        first = preso.ParagraphStyle(**{"fo:text-align": "center"})
+        second = preso.ParagraphStyle(**{"fo:text-align": "center"})
+        assert first.styles is second.styles
+        assert first.name == second.name
+
+
+def test_previous_output_reused(tmp_path):
+    from odplib import zipwrap
+
+    first = str(tmp_path / "first.odp")
+    second = str(tmp_path / "second.odp")
+    with preso.RenderContext():
+        p = preso.Preso()
+        p.add_slide().write("unchanged")
+        p.to_file(first).close()
+
+    with preso.RenderContext():
+        p = preso.Preso()
+        p.add_slide().write("changed")
+        index = zipwrap.MemberIndex(first)
+        p.previous_output = index
+        p.to_file(second).close()
+        index.close()
+    # everything but content.xml
+    assert index.reused == 5
+    with zipwrap.Zippier(second).z as z:
+        assert z.testzip() is None
+        assert b"changed" in z.read("content.xml")
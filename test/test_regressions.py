@@ -1,5 +1,7 @@
 
 import imp
+import io
+import os
 import unittest
 try:
     from StringIO import StringIO
@@ -181,25 +183,25 @@ Run with::
 
         '''
         desired = '''<draw:text-box>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">Ann Author</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">foo@bar.com</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">Data Science Institute, ICL</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">2017-11-30</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">@mehere</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">My university</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">Only connect</text:span>
                </text:p>
              </draw:text-box>'''
@@ -220,16 +222,16 @@ Run with::
 
         """
         desired = '''<draw:text-box>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">Ann Author</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">foo@bar.com</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">Data Science Institute, ICL</text:span>
                </text:p>
-               <text:p text:style-name="P0">
+               <text:p text:style-name="P1">
                  <text:span text:style-name="T0">2017-11-30</text:span>
                </text:p>
              </draw:text-box>'''
@@ -389,6 +391,436 @@ def _contains_lines(haystack, needle, ignore_whitespace=True):
             return True
     return False
 
+def _resolved_pages(data):
+    """
+    Pages of an .odp with references to automatic styles replaced by the
+    styles' properties, ids numbered in order and pictures named by their
+    content, to compare builds that name them differently
+    """
+    import copy
+    import hashlib
+    from lxml import etree
+    z = zipwrap.Zippier(StringIO(data))
+    root = etree.fromstring(z.cat('content.xml', True))
+    auto = root.find(preso.ns('office', 'automatic-styles'))
+    styles = dict((preso._style_id(node), node) for node in auto)
+    id_attrs = (preso.ns('draw', 'id'), preso.ns('text', 'id'),
+                preso.ns('smil', 'targetElement'))
+    href = preso.ns('xlink', 'href')
+    ids = {}
+    pages = []
+    for page in root.iter(preso.ns('draw', 'page')):
+        page = copy.deepcopy(page)
+        for node in page.iter():
+            for attr, value in node.items():
+                if attr.endswith('style-name'):
+                    style = styles.get((preso._ref_family(node, attr), value))
+                    if style is not None:
+                        node.set(attr, repr(preso._style_key(style)))
+                elif attr in id_attrs:
+                    node.set(attr, ids.setdefault(value, str(len(ids))))
+                elif attr == href and value.startswith('Pictures/'):
+                    node.set(attr, hashlib.md5(z.cat(value, True)).hexdigest())
+        pages.append(etree.tostring(page))
+    return pages
+
+
+class TestConvert(unittest.TestCase):
+
+    def test_convert(self):
+        cwd = os.getcwd()
+        data = rst2odp.convert('Hello\n=====\n\n* world\n',
+                               base_dir=os.path.dirname(__file__))
+        self.assertEqual(os.getcwd(), cwd)
+        z = zipwrap.Zippier(StringIO(data))
+        self.assertTrue('world' in z.cat('content.xml'))
+
+    def test_convert_to_stream(self):
+        fout = StringIO()
+        size = rst2odp.convert_to_stream('Hello\n=====\n', fout)
+        self.assertEqual(size, len(fout.getvalue()))
+
+    def test_convert_options_are_keywords(self):
+        self.assertRaises(TypeError, rst2odp.convert, 'Hello\n=====\n', None)
+        self.assertRaises(TypeError, rst2odp.convert_to_stream,
+                          'Hello\n=====\n', StringIO(), None)
+
+    def test_convert_async(self):
+        import asyncio
+        import tempfile
+        here = os.path.dirname(os.path.abspath(__file__))
+        rst = 'Hello {}\n=======\n\n.. image:: snakes.jpg\n'
+
+        async def run():
+            return await asyncio.gather(*[
+                rst2odp.convert_async(rst.format(i), base_dir=here)
+                for i in range(3)])
+
+        seen = []
+        get = preso.RenderContext.read_file
+        def read_file(context, path):
+            seen.append(os.path.abspath(path) in context.file_data)
+            return get(context, path)
+        preso.RenderContext.read_file = read_file
+        try:
+            results = asyncio.run(run())
+        finally:
+            preso.RenderContext.read_file = get
+        for i, data in enumerate(results):
+            z = zipwrap.Zippier(StringIO(data))
+            self.assertTrue('Hello {}'.format(i) in z.cat('content.xml'))
+            self.assertEqual(len(z.ls('Pictures')), 1)
+        # pictures were read ahead
+        self.assertEqual(seen, [True] * 3)
+
+        fd, path = tempfile.mkstemp(suffix='.odp')
+        os.close(fd)
+        try:
+            size = asyncio.run(rst2odp.convert_async(
+                rst.format(9), base_dir=here, destination=path))
+            self.assertEqual(size, os.path.getsize(path))
+        finally:
+            os.remove(path)
+
+    def test_convert_async_bounds_conversions(self):
+        import asyncio
+        here = os.path.dirname(os.path.abspath(__file__))
+        rst = 'Hello {}\n=======\n\n.. image:: snakes.jpg\n'
+        in_memory = [0, 0]  # now, most
+
+        read = rst2odp.Reader.read
+        def parsed(*args):
+            in_memory[0] += 1
+            in_memory[1] = max(in_memory)
+            return read(*args)
+        translate = rst2odp.Writer.translate
+        def translated(writer):
+            try:
+                return translate(writer)
+            finally:
+                in_memory[0] -= 1
+
+        async def run():
+            with self.assertRaises(TypeError):
+                await rst2odp.convert_async('x\n', None)
+            return await asyncio.gather(*[
+                rst2odp.convert_async(rst.format(i), base_dir=here)
+                for i in range(4)])
+
+        conversions = rst2odp.ASYNC_CONVERSIONS
+        rst2odp.ASYNC_CONVERSIONS = 2
+        rst2odp.Reader.read = parsed
+        rst2odp.Writer.translate = translated
+        try:
+            results = asyncio.run(run())
+        finally:
+            rst2odp.ASYNC_CONVERSIONS = conversions
+            rst2odp.Reader.read = read
+            rst2odp.Writer.translate = translate
+        self.assertEqual(len(results), 4)
+        self.assertEqual(in_memory, [0, 2])
+
+    def test_pages_to_output_skips_sections(self):
+        rst = ('Title\n=====\n\nSkipped\n-------\n\n.. urlcolor: #123456\n\n'
+               '.. image:: missing.png\n\nKept\n----\n\n'
+               '* `link <http://example.com>`_\n')
+        data = rst2odp.convert(rst, pages_to_output='3')
+        z = zipwrap.Zippier(StringIO(data))
+        content = z.cat('content.xml')
+        self.assertTrue('draw:name="page3"' in content)
+        self.assertFalse('Skipped' in content)
+        self.assertTrue('#123456' in content)
+        self.assertEqual(z.ls('Pictures'), [])
+
+    def test_pages_to_output_after_generated_slides(self):
+        import shutil
+        import tempfile
+        tmp = tempfile.mkdtemp()
+        table = os.path.join(tmp, 'rows.csv')
+        with open(table, 'w') as fout:
+            fout.write('n,square\n')
+            fout.writelines('%d,%d\n' % (i, i * i) for i in range(8))
+        records = os.path.join(tmp, 'people.csv')
+        with open(records, 'w') as fout:
+            fout.write('name\nAnn\nBob\nCy\n')
+        rst = ('Deck\n====\n\nNumbers\n-------\n\n'
+               '.. bulk-table:: %s\n   :header-rows: 1\n   :rows-per-slide: 2\n\n'
+               'Hi {name}\n---------\n\n'
+               '.. generate-slides:: %s\n\n'
+               'Last\n----\n\nbye\n' % (table, records))
+        try:
+            data = rst2odp.convert(rst, pages_to_output='9')
+        finally:
+            shutil.rmtree(tmp)
+        content = zipwrap.Zippier(StringIO(data)).cat('content.xml')
+        self.assertTrue('draw:name="page9"' in content)
+        self.assertTrue('bye' in content)
+        self.assertFalse('Hi Cy' in content)
+
+    def test_incremental_graphic_properties(self):
+        import shutil
+        import tempfile
+        rst = ('Deck\n====\n\nStyled\n------\n\n'
+               '.. graphic-properties: boxed {"draw:fill-color": "#772953"}\n\n'
+               '.. class:: boxed\n\n  text\n\nAgain\n-----\n\n'
+               '.. graphic-properties: boxed {"draw:fill-color": "#772953"}\n\n'
+               '.. class:: boxed\n\n  more\n\nLast\n----\n\nbye\n')
+        names = []
+        finish = preso.Preso._finish_auto_styles
+        def record(p):
+            names.append([n.get(preso.ns('style', 'name'))
+                          for n in p._auto_styles])
+            return finish(p)
+        cache_dir = tempfile.mkdtemp()
+        preso.Preso._finish_auto_styles = record
+        try:
+            first = rst2odp.convert(rst, incremental=True, cache_dir=cache_dir)
+            second = rst2odp.convert(rst, incremental=True, cache_dir=cache_dir)
+        finally:
+            preso.Preso._finish_auto_styles = finish
+            shutil.rmtree(cache_dir)
+        # the second build splices the cached sections
+        self.assertEqual(names[1], names[0])
+        self.assertEqual(len(set(names[1])), len(names[1]))
+        self.assertTrue('#772953' in zipwrap.Zippier(StringIO(second)).cat('content.xml'))
+
+    def test_incremental_matches_clean_build(self):
+        import shutil
+        import tempfile
+        doc = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'doc')
+        with open(os.path.join(doc, 'intro.rst')) as fin:
+            rst = fin.read()
+        expected = _resolved_pages(rst2odp.convert(rst, base_dir=doc))
+        cache_dir = tempfile.mkdtemp()
+        try:
+            builds = [_resolved_pages(rst2odp.convert(
+                rst, base_dir=doc, incremental=True, cache_dir=cache_dir))
+                for i in range(2)]
+        finally:
+            shutil.rmtree(cache_dir)
+        for pages in builds:
+            self.assertEqual(len(pages), len(expected))
+            for page, (got, want) in enumerate(zip(pages, expected), 1):
+                self.assertEqual(got, want, 'page %d' % page)
+
+    def test_generate_slides_missing_image(self):
+        import shutil
+        import tempfile
+        here = os.path.dirname(os.path.abspath(__file__))
+        tmp = tempfile.mkdtemp()
+        records = os.path.join(tmp, 'people.csv')
+        with open(records, 'w') as fout:
+            fout.write('name,logo\nAnn,{0}\nBob,\nCy,{0}\n'.format(
+                os.path.join(here, 'snakes.jpg')))
+        rst = ('Deck\n====\n\nIntro\n-----\n\nhello\n\n'
+               'Hi {name}\n---------\n\n'
+               '.. image:: snakes.jpg\n\n'
+               '.. generate-slides:: %s\n   :images: logo\n' % records)
+        warnings = io.StringIO()
+        try:
+            data = rst2odp.convert(rst, base_dir=here, warning_stream=warnings)
+        finally:
+            shutil.rmtree(tmp)
+        content = zipwrap.Zippier(StringIO(data)).cat('content.xml')
+        self.assertTrue('Hi Ann' in content and 'Hi Cy' in content)
+        self.assertFalse('Hi Bob' in content)
+        self.assertTrue('record 2 of' in warnings.getvalue())
+        self.assertTrue('has no logo field' in warnings.getvalue())
+
+    def test_profile_trace(self):
+        import json
+        import tempfile
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            rst2odp.convert('Hello\n=====\n\nCode\n----\n\n'
+                            '.. code-block:: python\n\n  x = 1\n\n'
+                            'End\n---\n\nbye\n',
+                            profile_trace=path)
+            events = json.load(open(path))['traceEvents']
+        finally:
+            os.remove(path)
+        names = set(e['name'] for e in events)
+        for name in ['docutils parse', 'translate section', 'highlight code',
+                     'to_xml', 'pack']:
+            self.assertTrue(name in names, name)
+        self.assertTrue(all(e['ph'] == 'X' and e['dur'] >= 0 for e in events))
+
+    def test_memory_report(self):
+        import contextlib
+        import io
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            rst2odp.convert('Hello\n=====\n\nOne\n---\n\n* a\n\n'
+                            'Two\n---\n\n* b\n', memory_report=True)
+        report = err.getvalue()
+        self.assertTrue('Peak traced memory by phase:' in report)
+        self.assertTrue('  translate' in report)
+        self.assertTrue('Per slide:' in report)
+        self.assertTrue('\n      3 ' in report)
+
+    def test_translate_jobs(self):
+        from lxml import etree
+        parts = ['Deck\n====\n\n']
+        for i in range(30):
+            parts.append('Slide {0}\n--------\n\n* point *{0}*\n\n'.format(i))
+            if i == 12:
+                parts.append('.. urlcolor: #00ff00\n\n')
+            if i % 10 == 5:
+                parts.append('.. code-block:: python\n\n  x = {}\n\n'.format(i))
+            parts.append('* `link <http://example.com/{}>`_\n\n'.format(i))
+        rst = ''.join(parts)
+
+        def pages(data):
+            content = zipwrap.Zippier(StringIO(data)).cat('content.xml', True)
+            root = etree.fromstring(content)
+            names = dict(
+                (node.get(preso.ns('style', 'name')), node)
+                for node in root.iter(preso.ns('style', 'style')))
+            result = []
+            for page in root.iter(preso.ns('draw', 'page')):
+                colors = [names[n.get(preso.ns('text', 'style-name'))].find(
+                    preso.ns('style', 'text-properties')).get(preso.ns('fo', 'color'))
+                    for n in page.iter(preso.ns('text', 'span'))
+                    if n.get(preso.ns('text', 'style-name')) in names]
+                result.append((''.join(page.itertext()), colors))
+            return result
+
+        expected = pages(rst2odp.convert(rst))
+        self.assertEqual(len(expected), 31)
+        self.assertEqual(pages(rst2odp.convert(rst, translate_jobs=2)), expected)
+
+    def test_translate_jobs_intro(self):
+        doc = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'doc')
+        with open(os.path.join(doc, 'intro.rst')) as fin:
+            rst = fin.read()
+        expected = _resolved_pages(rst2odp.convert(rst, base_dir=doc))
+        jobs = _resolved_pages(rst2odp.convert(rst, base_dir=doc,
+                                               translate_jobs=2))
+        self.assertEqual(len(jobs), len(expected))
+        for page, (got, want) in enumerate(zip(jobs, expected), 1):
+            self.assertEqual(got, want, 'page %d' % page)
+
+    def test_translate_jobs_in_threads(self):
+        from concurrent import futures
+        decks = [''.join(['Deck {}\n======\n\n'.format(i)] + [
+            'Slide {0}\n--------\n\n* point {0}\n\n'.format(j)
+            for j in range(20)]) for i in range(2)]
+        planned = []
+        plan = rst2odp.ODPTranslator._plan_shards
+        def record(translator, document):
+            planned.append(plan(translator, document))
+            return planned[-1]
+        rst2odp.ODPTranslator._plan_shards = record
+        try:
+            expected = [rst2odp.convert(deck) for deck in decks]
+            with futures.ThreadPoolExecutor(2) as pool:
+                results = list(pool.map(
+                    lambda deck: rst2odp.convert(deck, translate_jobs=2), decks))
+        finally:
+            rst2odp.ODPTranslator._plan_shards = plan
+        # workers aren't forked while other threads run
+        self.assertEqual(planned, [[], []])
+        for data, deck in zip(results, expected):
+            self.assertEqual(zipwrap.Zippier(StringIO(data)).cat('content.xml'),
+                             zipwrap.Zippier(StringIO(deck)).cat('content.xml'))
+
+    def test_translate_jobs_error_stops_workers(self):
+        import multiprocessing
+        rst = ''.join(['Deck\n====\n\n'] + [
+            'Slide {0}\n--------\n\n* point {0}\n\n'.format(j)
+            for j in range(20)] + ['Bad\n---\n\n.. import: missing.odp 1\n'])
+        self.assertRaises(Exception, rst2odp.convert, rst, translate_jobs=2)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_convert_in_threads(self):
+        from concurrent import futures
+        decks = []
+        for i in range(6):
+            decks.append((
+                'Deck {0}\n=======\n\n.. urlcolor: #00000{0}\n\n'
+                '* `link <http://example.com/{0}>`_\n\n'
+                'Code\n====\n\n.. code-block:: python\n\n'
+                '  x = {0}\n'.format(i),
+                {'mono_font': 'Mono{}'.format(i)}))
+
+        def content(deck):
+            data = rst2odp.convert(deck[0], **deck[1])
+            return zipwrap.Zippier(StringIO(data)).cat('content.xml')
+
+        expected = [content(deck) for deck in decks]
+        with futures.ThreadPoolExecutor(len(decks)) as pool:
+            self.assertEqual(list(pool.map(content, decks * 3)), expected * 3)
+        self.assertTrue('Mono5' in expected[5])
+        self.assertFalse('Mono5' in expected[4])
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp()
+        self.sources = []
+        for name in ['a', 'b']:
+            path = os.path.join(self.tmp, name + '.rst')
+            with open(path, 'w') as fout:
+                fout.write('Deck {0}\n======\n\n* {0}\n'.format(name))
+            self.sources.append(path)
+        here = os.path.dirname(os.path.abspath(__file__))
+        self.template = os.path.join(here, 'data', 'templates', 'redsmall.otp')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def _batch(self, args):
+        import contextlib
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            status = rst2odp.batch(['--batch'] + args)
+        return status, err.getvalue()
+
+    def _master_page(self, path):
+        z = zipwrap.Zippier(path)
+        return 'style:name="redsmall"' in z.cat('styles.xml')
+
+    def test_options_after_separator(self):
+        out = os.path.join(self.tmp, 'out')
+        for jobs in ['1', '2']:
+            status, err = self._batch(
+                ['-j', jobs, '--output-dir', out] + self.sources +
+                ['--', '--template-file', self.template])
+            self.assertEqual(status, 0, err)
+            self.assertTrue('2 converted, 0 failed' in err)
+            for name in ['a.odp', 'b.odp']:
+                self.assertTrue(self._master_page(os.path.join(out, name)))
+
+    def test_options_before_separator_are_errors(self):
+        import contextlib
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit) as cm:
+                rst2odp.batch(['--batch', self.sources[0], '--template-file',
+                               self.template, self.sources[1]])
+        self.assertEqual(cm.exception.code, 2)
+
+    def test_manifest_and_exit_status(self):
+        manifest = os.path.join(self.tmp, 'manifest.txt')
+        dst = os.path.join(self.tmp, 'named.odp')
+        missing = os.path.join(self.tmp, 'missing.rst')
+        with open(manifest, 'w') as fout:
+            fout.write('# decks\n{} {}\n\n{}  # gone\n'.format(
+                self.sources[0], dst, missing))
+        status, err = self._batch(['-j', '1', '--manifest', manifest])
+        self.assertEqual(status, 1)
+        self.assertTrue(os.path.exists(dst))
+        self.assertTrue('FAIL' in err and missing in err)
+        self.assertTrue('1 converted, 1 failed' in err)
+        self.assertEqual(self._batch(['-j', '1', self.sources[1]])[0], 0)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'b.odp')))
+
+
 if __name__ == '__main__':
     unittest.main()
     # import doctest
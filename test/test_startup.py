@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules only needed for images, code or debugging output
+HEAVY = ["PIL", "pygments", "xml.dom.minidom", "tempfile"]
+
+# loose limit on the best of RUNS imports (about 0.1s here), catches an
+# import pulling in something slow, not noise.  ODPLIB_IMPORT_BUDGET
+# overrides it on slow machines.
+IMPORT_BUDGET = float(os.environ.get("ODPLIB_IMPORT_BUDGET", "0.75"))
+RUNS = 3
+
+SCRIPT = """
+import sys, time
+start = time.time()
+import odplib.preso
+print(time.time() - start)
+print(" ".join(m for m in {!r} if m in sys.modules))
+""".format(HEAVY)
+
+
+class TestStartup(unittest.TestCase):
+    def _import(self):
+        """ (seconds, heavy modules loaded) of importing odplib.preso """
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        out = subprocess.check_output([sys.executable, "-c", SCRIPT], env=env)
+        seconds, loaded = out.decode("utf-8").split("\n")[:2]
+        return float(seconds), loaded
+
+    def test_import_is_lazy(self):
+        seconds, loaded = self._import()
+        sys.stderr.write("import odplib.preso: {:.1f}ms\n".format(seconds * 1000))
+        self.assertEqual(loaded, "")
+
+    def test_import_time(self):
+        best = min(self._import()[0] for i in range(RUNS))
+        self.assertLess(
+            best,
+            IMPORT_BUDGET,
+            "import odplib.preso took {:.0f}ms".format(best * 1000),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import shutil
+import tempfile
+import unittest
+import os
+
+from odplib import preso, styleinfo
+
+
+class TestStyleInfo(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "deck.odp")
+        with preso.RenderContext():
+            p = preso.Preso()
+            for i in range(3):
+                s = p.add_slide()
+                s.push_style(preso.TextStyle(**{"fo:color": "#00000{}".format(i)}))
+                s.write("slide {}".format(i))
+                s.pop_style()
+            p.to_file(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_parse_slide_numbers(self):
+        self.assertEqual(styleinfo.parse_slide_numbers("3,1-2,9", 4), [1, 2, 3])
+        self.assertEqual(styleinfo.parse_slide_numbers(None, 2), [1, 2])
+
+    def test_slide_text_styles(self):
+        with preso.RenderContext():
+            records = list(styleinfo.slide_text_styles(self.path, "1,3"))
+        self.assertEqual([r["text"] for r in records], ["slide 0", "slide 2"])
+        record = records[1]
+        self.assertEqual(record["slide"], 3)
+        self.assertEqual(record["path"][-1], "text:span")
+        span = record["styles"][-1]
+        self.assertEqual((span["family"], span["chain"]), ("text", [span["name"]]))
+        self.assertEqual(record["properties"]["fo:color"], "#000002")
+        # presentation style of the frame comes from styles.xml
+        frame = [s for s in record["styles"] if s["element"] == "draw:frame"][0]
+        self.assertTrue(frame["chain"][-1].startswith("Default-outline1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
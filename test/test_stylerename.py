@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from odplib import preso, stylerename
+
+
+class TestStyleRename(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.paths = []
+        with preso.RenderContext():
+            for i in range(2):
+                p = preso.Preso()
+                p.add_slide().write("text")
+                path = os.path.join(self.dir, "t{}.otp".format(i))
+                p.to_file(path)
+                self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_longest_prefix_wins(self):
+        renamer = stylerename.StyleRenamer([("t1", "a"), ("t10", "b")])
+        self.assertEqual(renamer.rename_value("t10-title"), "b-title")
+        self.assertEqual(renamer.rename_value("t1-title"), "a-title")
+        self.assertEqual(renamer.rename_value("x-t1"), "x-t1")
+
+    def test_parse_renames(self):
+        self.assertEqual(
+            stylerename.parse_renames("1:a,Default:b", "tmpl"),
+            [("tmpl1", "a"), ("Default", "b")],
+        )
+
+    def test_rename_template(self):
+        for path in self.paths:
+            with zipfile.ZipFile(path) as z:
+                before = dict((i.filename, i.compress_size) for i in z.infolist())
+                content = z.read("content.xml")
+            changed = stylerename.rename_template(path, "Default:Plain", add_prefix=False)
+            self.assertTrue(changed > 1)
+
+            t = preso.Template(path)
+            self.assertEqual(list(t.get_master_page_names()), ["Plain"])
+            self.assertIn(b"Plain-outline1", preso.to_xml(t.styles))
+            with zipfile.ZipFile(path) as z:
+                self.assertIsNone(z.testzip())
+                infos = z.infolist()
+                self.assertEqual(infos[0].filename, "mimetype")
+                self.assertEqual(sorted(before), sorted(i.filename for i in infos))
+                self.assertEqual(z.getinfo("content.xml").compress_size, before["content.xml"])
+                self.assertEqual(z.read("content.xml"), content)
+
+    def test_unknown_master_page(self):
+        with self.assertRaises(Exception):
+            stylerename.rename_template(self.paths[0], "Missing:Plain", add_prefix=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import threading
+
+from odplib import tracing
+
+
+def _nested_spans(tracer, count):
+    for i in range(count):
+        with tracer.span("outer"):
+            with tracer.span("inner"):
+                data = [0] * 1000
+            del data
+
+
+def test_memory_spans_in_threads():
+    tracer = tracing.Tracer(memory=True)
+    try:
+        threads = [
+            threading.Thread(target=_nested_spans, args=(tracer, 50))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        _nested_spans(tracer, 1)
+        assert len(tracer.events) == 2 * (4 * 50 + 1)
+        for event in tracer.events:
+            assert event["args"]["memory_peak"] >= 0
+        # every thread closed all its spans
+        assert [len(peaks) for peaks in tracer._stacks] == [1] * 5
+        assert tracer.memory_peak() > 0
+    finally:
+        tracer.stop_memory()
+
+
+def test_memory_without_reset_peak():
+    tracer = tracing.Tracer(memory=True)
+    # like Python < 3.9
+    tracer._reset_peak = None
+    try:
+        _nested_spans(tracer, 2)
+        inner = [e for e in tracer.events if e["name"] == "inner"]
+        assert all(e["args"]["memory_peak"] > 0 for e in inner)
+    finally:
+        tracer.stop_memory()
@@ -0,0 +1,55 @@
+import zipfile
+import zlib
+
+import pytest
+
+from odplib import zipwrap
+
+MEMBERS = {"a.xml": b"<a>" + b"x" * 1000 + b"</a>", "b.txt": b"b"}
+
+
+@pytest.fixture(params=[True, False], ids=["raw", "fallback"])
+def raw(request, monkeypatch):
+    if not request.param:
+        # like a zipfile without the internals raw access uses
+        monkeypatch.setattr(zipwrap, "raw_access", lambda zfile: False)
+    return request.param
+
+
+def _write(path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zout:
+        for name, data in MEMBERS.items():
+            zout.writestr(name, data)
+
+
+def test_rewrite(tmp_path, raw):
+    path = str(tmp_path / "in.zip")
+    _write(path)
+    zipwrap.rewrite(path, path, {"b.txt": b"new"})
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        assert z.namelist() == ["a.xml", "b.txt"]
+        assert z.read("a.xml") == MEMBERS["a.xml"]
+        assert z.read("b.txt") == b"new"
+
+
+def test_write_deflated(tmp_path, raw):
+    path = str(tmp_path / "out.zip")
+    data = MEMBERS["a.xml"]
+    payload = zlib.compress(data)[2:-4]
+    z = zipwrap.Zippier(path, "w")
+    z.write_deflated("a.xml", payload, zlib.crc32(data) & 0xFFFFFFFF, len(data))
+    z.close()
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        assert z.read("a.xml") == data
+
+
+def test_member_index(tmp_path, raw):
+    path = str(tmp_path / "in.zip")
+    _write(path)
+    index = zipwrap.MemberIndex(path)
+    payload, crc, size = index.get(MEMBERS["a.xml"])
+    assert zlib.decompress(payload, -15) == MEMBERS["a.xml"]
+    assert index.get(b"other") is None
+    index.close()